@@ -0,0 +1,131 @@
+__author__ = 'Musa Morena Marcusso Manhaes'
+
+import os
+import sys
+import shutil
+import tempfile
+import multiprocessing
+from time import time
+import numpy as np
+from processor import S4SParser
+from processor import S4SParallelParser
+from processor import S4SGridder
+
+
+def create_xyz_file(filename, n_points, header=True, comment_period=None):
+    # comment_period inserts a comment line after every comment_period points, e.g. scan line markers
+    x, y = np.meshgrid(np.linspace(-10.0, 10.0, int(np.sqrt(n_points))),
+                       np.linspace(-10.0, 10.0, int(np.sqrt(n_points))))
+    z = 0.01 * np.sin(x) * np.cos(y) + 1e-4 * np.random.randn(*x.shape)
+    fid = open(filename, 'w')
+    if header:
+        fid.write('# Synthetic Scan4Surf measurement\n')
+        fid.write('X Y Z\n')
+    points = np.vstack((x.flatten(), y.flatten(), z.flatten())).T
+    if comment_period is None:
+        np.savetxt(fid, points, fmt='%.6f')
+    else:
+        for i in range(0, points.shape[0], comment_period):
+            np.savetxt(fid, points[i:i + comment_period], fmt='%.6f')
+            fid.write('# Scan line %d\n' % (i / comment_period))
+    fid.close()
+
+
+def read_file_time(filename):
+    # Reference time to read the file from disk without parsing it
+    start = time()
+    fid = open(filename, 'rb')
+    while fid.read(S4SParser.S4SParser._BLOCK_SIZE):
+        pass
+    fid.close()
+    return time() - start
+
+
+def bench_parser(n_points=1000000):
+    # The parse time is reported relative to reading the (cached) file without parsing it. Files with periodic
+    # comment lines are parsed line by line around every comment and are much slower
+    temp_dir = tempfile.mkdtemp()
+    try:
+        filename = os.path.join(temp_dir, 'benchmark.asc')
+        for label, comment_period in [('no comments', None), ('comment every 1000 points', 1000)]:
+            create_xyz_file(filename, n_points, comment_period=comment_period)
+            size_mb = os.path.getsize(filename) / 1e6
+
+            read_time = read_file_time(filename)
+
+            print 'File size = %.1f MB, %s' % (size_mb, label)
+            print '%-12s %10s %10s %12s %12s' % ('Parser', 'Time [s]', 'MB/s', 'Points', 'x disk read')
+            print '%-12s %10.3f %10.1f %12s %12.1f' % ('disk read', read_time, size_mb / read_time, '-', 1.0)
+            for dtype in [np.float64, np.float32]:
+                parser = S4SParser.S4SParser(dtype=dtype)
+                start = time()
+                points = parser.parse_file(filename)
+                elapsed = time() - start
+                print '%-12s %10.3f %10.1f %12d %12.1f' % (np.dtype(dtype).name, elapsed, size_mb / elapsed,
+                                                          points.shape[0], elapsed / read_time)
+    finally:
+        shutil.rmtree(temp_dir)
+
+
+def bench_parallel_parser(n_points=4000000):
+    temp_dir = tempfile.mkdtemp()
+    try:
+        filename = os.path.join(temp_dir, 'benchmark.asc')
+        create_xyz_file(filename, n_points)
+        size_mb = os.path.getsize(filename) / 1e6
+
+        parser = S4SParser.S4SParser()
+        start = time()
+        reference = parser.parse_file(filename)
+        serial_time = time() - start
+
+        print 'File size = %.1f MB' % size_mb
+        print '%-12s %10s %10s %10s' % ('Processes', 'Time [s]', 'MB/s', 'Speedup')
+        print '%-12s %10.3f %10.1f %10.2f' % ('serial', serial_time, size_mb / serial_time, 1.0)
+        n = 2
+        while n <= multiprocessing.cpu_count():
+            start = time()
+            points = S4SParallelParser.S4SParallelParser(parser, n).parse_file(filename)
+            elapsed = time() - start
+            assert np.array_equal(points, reference)
+            print '%-12d %10.3f %10.1f %10.2f' % (n, elapsed, size_mb / elapsed, serial_time / elapsed)
+            n *= 2
+    finally:
+        shutil.rmtree(temp_dir)
+
+
+SURFACES = {'plane': lambda x, y: 0.01 * x - 0.02 * y + 1.0,
+            'waves': lambda x, y: 0.05 * np.sin(2.0 * x) * np.cos(3.0 * y),
+            'sphere': lambda x, y: np.sqrt(np.maximum(400.0 - x ** 2 - y ** 2, 0.0)) - 20.0}
+
+
+def bench_gridding(n_points=1000000, grid_size=1000):
+    rs = np.random.RandomState(0)
+    x = rs.uniform(-5.0, 5.0, n_points)
+    y = rs.uniform(-5.0, 5.0, n_points)
+    x_axis = np.linspace(-5.0, 5.0, grid_size)
+    y_axis = np.linspace(-5.0, 5.0, grid_size)
+    x_grid, y_grid = np.meshgrid(x_axis, y_axis)
+
+    print 'Points = %d, grid = %d x %d' % (n_points, grid_size, grid_size)
+    print '%-8s %-12s %10s %14s %10s' % ('Surface', 'Method', 'Time [s]', 'RMS error [mm]', 'Coverage')
+    for name in sorted(SURFACES.keys()):
+        gridder = S4SGridder.S4SGridder(np.vstack((x, y, SURFACES[name](x, y))).T)
+        reference = SURFACES[name](x_grid, y_grid)
+        for method in S4SGridder.S4SGridder.get_methods():
+            start = time()
+            z = gridder.grid(x_axis, y_axis, method)
+            elapsed = time() - start
+            valid = np.logical_not(np.isnan(z))
+            error = np.sqrt(np.mean((z[valid] - reference[valid]) ** 2))
+            print '%-8s %-12s %10.3f %14.2e %9.1f%%' % (name, method, elapsed, error,
+                                                       100.0 * np.count_nonzero(valid) / z.size)
+
+
+if __name__ == '__main__':
+    n = int(sys.argv[1]) if len(sys.argv) > 1 else 1000000
+    bench_parser(n)
+    print ' '
+    bench_parallel_parser(4 * n)
+    print ' '
+    bench_gridding(n, int(np.sqrt(n)))
@@ -22,6 +22,7 @@ import time
 import numpy as np
 from matplotlib import cm
 from matplotlib.figure import Figure
+from matplotlib.colors import Normalize
 import mpl_toolkits.mplot3d as Axes3D
 from matplotlib.lines import Line2D
 import matplotlib.patches as pt
@@ -45,7 +46,11 @@ class S4SCanvas(object, S4SBase.S4SBase):
                'PS': 'ps',
                'EPS': 'eps',
                'SVG': 'svg'}
-    _MASK_TYPES = ['circle', 'rect']
+    _MASK_TYPES = ['circle', 'rect', 'polygon']
+    # Opacity of the points excluded by the mask being drawn
+    _PREVIEW_ALPHA = 0.15
+    # Minimum distance between two consecutive lasso vertices [pixels], the motion events in between are ignored
+    _LASSO_MIN_PIXELS = 4
 
     def __init__(self, options_window=None):
         S4SBase.S4SBase.__init__(self)
@@ -65,6 +70,7 @@ class S4SCanvas(object, S4SBase.S4SBase):
 
         self._figure.canvas.mpl_connect('button_press_event', self._on_mouse_press)
         self._figure.canvas.mpl_connect('motion_notify_event', self._on_mouse_motion)
+        self._figure.canvas.mpl_connect('button_release_event', self._on_mouse_release)
 
         self._plots = {'main_plot': None,
                        'plane': None}
@@ -88,6 +94,8 @@ class S4SCanvas(object, S4SBase.S4SBase):
 
         self._start_capture = False
         self._capture_points = []
+        # Position in pixels of the last lasso vertex
+        self._capture_pixel = None
         self._mask_form = None
         self._mask_type = None
 
@@ -102,6 +110,11 @@ class S4SCanvas(object, S4SBase.S4SBase):
         self._color_bar = None
         self._exp_window = None
         self._callback_capture = None
+        # Preview the effect of the mask being drawn on the plotted points
+        self._use_mask_preview = True
+        self._capture_is_exc = False
+        # RGBA colors of the plotted points while the mask preview is active
+        self._preview_colors = None
 
         self._options_window = S4SPlotOptionsWindow.S4SPlotOptionsWindow(title=self.get_title(),
                                                                          xlabel=self.get_xlabel(),
@@ -172,7 +185,7 @@ class S4SCanvas(object, S4SBase.S4SBase):
 
     def set_plot_3d(self, is_3d=True):
         self._is_plot_3d = is_3d
-        self._enable_widgets(['add_circle_mask', 'add_rect_mask', 'exclude_points'], not is_3d)
+        self._enable_widgets(['add_circle_mask', 'add_rect_mask', 'add_polygon_mask', 'exclude_points'], not is_3d)
         self.set_new_axes()
         self.run_plot()
 
@@ -254,15 +267,19 @@ class S4SCanvas(object, S4SBase.S4SBase):
     def get_zlabel(self):
         return self._zlabel
 
-    def start_capture(self, type_mask, callback):
+    def start_capture(self, type_mask, callback, is_exc=False):
         if type_mask not in self._MASK_TYPES:
             return False
         self._start_capture = True
         self._capture_points = []
         self._mask_type = type_mask
         self._callback_capture = callback
+        self._capture_is_exc = is_exc
         return True
 
+    def set_mask_preview(self, is_active):
+        self._use_mask_preview = is_active
+
     def clear_figure(self):
         self._figure.clf()
         self._color_bar = None
@@ -413,6 +430,7 @@ class S4SCanvas(object, S4SBase.S4SBase):
 
     def _set_new_plot(self):
         self._updating_plot = True
+        self._preview_colors = None
         if self._axes is None:
             self.set_new_axes()
 
@@ -582,6 +600,17 @@ class S4SCanvas(object, S4SBase.S4SBase):
         if not self._start_capture:
             return
 
+        if self._mask_type == 'polygon':
+            # The lasso is drawn while the button is pressed and closed when it is released
+            if event.xdata is None or event.ydata is None:
+                return
+            self._capture_points = [(event.xdata, event.ydata)]
+            self._capture_pixel = (event.x, event.y)
+            if self._mask_form is None:
+                self._mask_form = Line2D([], [], color='black', linewidth=2)
+                self._axes.add_line(self._mask_form)
+            return
+
         if len(self._capture_points) == 2:
             return
 
@@ -615,6 +644,21 @@ class S4SCanvas(object, S4SBase.S4SBase):
         if not self._start_capture:
             return
 
+        if self._mask_type == 'polygon':
+            if len(self._capture_points) == 0 or event.xdata is None or event.ydata is None:
+                return
+            if np.hypot(event.x - self._capture_pixel[0], event.y - self._capture_pixel[1]) < self._LASSO_MIN_PIXELS:
+                return
+            self._capture_points.append((event.xdata, event.ydata))
+            self._capture_pixel = (event.x, event.y)
+            xs = [p[0] for p in self._capture_points] + [self._capture_points[0][0]]
+            ys = [p[1] for p in self._capture_points] + [self._capture_points[0][1]]
+            self._mask_form.set_data(xs, ys)
+            if len(self._capture_points) >= 3:
+                self._preview_mask([list(p) for p in self._capture_points])
+            self._figure.canvas.draw_idle()
+            return
+
         if len(self._capture_points) != 1:
             return
 
@@ -631,13 +675,59 @@ class S4SCanvas(object, S4SBase.S4SBase):
             radius = np.sqrt((event.xdata - x)**2 + (event.ydata - y)**2)
             xs = radius * np.cos(t) + x
             ys = radius * np.sin(t) + y
+            self._preview_mask([(x, y), radius])
         elif self._mask_type == 'rect':
             xs = [x, event.xdata, event.xdata, x, x]
             ys = [y, y, event.ydata, event.ydata, y]
+            self._preview_mask([[min(x, event.xdata), min(y, event.ydata)],
+                                [max(x, event.xdata), max(y, event.ydata)]])
 
         if self._mask_form is None:
             self._mask_form = Line2D(xdata=xs, ydata=ys, color='black', linewidth=2)
             self._axes.add_line(self._mask_form)
         else:
             self._mask_form.set_data(xs, ys)
-        self._figure.canvas.draw()
\ No newline at end of file
+        # Redraw when the GUI is idle so fast mouse motion does not queue full redraws
+        self._figure.canvas.draw_idle()
+
+    def _preview_mask(self, points):
+        # Dim the plotted points excluded by the mask being drawn, the candidate mask is only evaluated on the
+        # decimated data of the plot, the full resolution mask is computed once the mask is added
+        if not self._use_mask_preview or self._is_plot_3d or not self._plot_types['Scatter']['on']:
+            return
+        if self._plots['main_plot'] is None or self._xs is None:
+            return
+
+        with np.errstate(invalid='ignore'):
+            selected = self.processor.preview_mask(self._mask_type, points, self._capture_is_exc,
+                                                   self._xs, self._ys, self._zs)
+        if selected is None:
+            return
+
+        if self._preview_colors is None:
+            norm = Normalize(vmin=self._clim[0], vmax=self._clim[1])
+            self._preview_colors = cm.get_cmap(self._COLORMAPS[self._colormap_index])(norm(self._cs.flatten()))
+            # Without the data array the collection keeps the colors set below instead of mapping the data
+            self._plots['main_plot'].set_array(None)
+
+        colors = self._preview_colors.copy()
+        colors[:, 3] = np.where(selected.flatten(), 1.0, self._PREVIEW_ALPHA)
+        self._plots['main_plot'].set_facecolors(colors)
+
+    def _on_mouse_release(self, event):
+        if not self._start_capture or self._mask_type != 'polygon' or len(self._capture_points) == 0:
+            return
+
+        self._start_capture = False
+        self._mask_form.set_data([], [])
+        self._figure.canvas.draw()
+
+        if len(self._capture_points) < 3:
+            self._capture_points = []
+            # Restore the colors dimmed by the mask preview
+            if self._preview_colors is not None:
+                self.run_plot()
+            return
+
+        if self._callback_capture is not None:
+            self._callback_capture(self._mask_type, [list(p) for p in self._capture_points])
@@ -28,7 +28,8 @@ class S4SMainWindow(S4SBase.S4SBase):
     _DEFAULT_EXT = ['asc']
     _WIDGETS_ACTIVE_AFTER_LOADED = ['notebook', 'save_cur_image', 'set_3d_toolbar', 'set_equal_scale',
                                     'set_scatter_plot', 'set_plane_fit', 'center_color', 'reset_color',
-                                    'add_circle_mask', 'add_rect_mask', 'exclude_points', 'delete_all_masks',
+                                    'add_circle_mask', 'add_rect_mask', 'add_polygon_mask', 'exclude_points',
+                                    'delete_all_masks',
                                     'file_label', 'file_comment']
     _ICON_IMAGES = {'set_3d_image': './gui/icons/3d_icon.png',
                     'set_equal_scale_image': './gui/icons/equal_icon.png',
@@ -58,6 +59,7 @@ class S4SMainWindow(S4SBase.S4SBase):
                          'open_plot_options': ('clicked', self._open_plot_options_clicked),
                          'add_circle_mask': ('clicked', self._add_new_circle_mask_clicked),
                          'add_rect_mask': ('clicked', self._add_new_rect_mask_clicked),
+                         'add_polygon_mask': ('clicked', self._add_new_polygon_mask_clicked),
                          'extensions_entry': ('activate', self._ext_text_changed),
                          'file_label': ('activate', self._file_label_changed),
                          'file_comment': ('activate', self._file_comment_changed)}
@@ -89,7 +91,7 @@ class S4SMainWindow(S4SBase.S4SBase):
         self._set_dir_string()
 
         # Setting the extensions for measurement files
-        self._file_ext = deepcopy(self._DEFAULT_EXT)
+        self._file_ext = deepcopy(self._DEFAULT_EXT) + self.processor.get_binary_extensions()
 
         self._spinner = self.builder.get_object('spinner')
 
@@ -219,7 +221,7 @@ class S4SMainWindow(S4SBase.S4SBase):
         entry_text = widget.get_text()
         ext_list = entry_text.split(';')
         for ext in ext_list:
-            if not ext.isalpha():
+            if not ext.isalnum():
                 self._set_extensions()
                 return
         self._file_ext = ext_list
@@ -234,7 +236,7 @@ class S4SMainWindow(S4SBase.S4SBase):
         sizes = []
         for f in os.listdir(self._cur_directory):
             for ext in self._file_ext:
-                if '.' + ext in f:
+                if f.endswith('.' + ext):
                     full_path = os.path.join(self._cur_directory, f)
 
                     files.append(f)
@@ -296,11 +298,14 @@ class S4SMainWindow(S4SBase.S4SBase):
         gtk.gdk.threads_leave()
 
     def callback_add_mask(self, mask_type, points):
-        if mask_type not in ['circle', 'rect']:
+        if mask_type not in ['circle', 'rect', 'polygon']:
             return
         if type(points) != list:
             return
-        if len(points) != 2:
+        if mask_type == 'polygon':
+            if len(points) < 3:
+                return
+        elif len(points) != 2:
             return
 
         if mask_type == 'circle':
@@ -310,6 +315,9 @@ class S4SMainWindow(S4SBase.S4SBase):
         elif mask_type == 'rect':
             index = self.processor.add_rect_mask(low_point=list(points[0]), upper_point=list(points[1]),
                                                  is_exc=self.builder.get_object('exclude_points').get_active())
+        elif mask_type == 'polygon':
+            index = self.processor.add_polygon_mask(vertices=points,
+                                                    is_exc=self.builder.get_object('exclude_points').get_active())
 
         self.processor.set_mask_active(index, True)
         self.processor.update_masks()
@@ -317,10 +325,16 @@ class S4SMainWindow(S4SBase.S4SBase):
         self._update_plot()
 
     def _add_new_circle_mask_clicked(self, widget):
-        self._canvas.start_capture('circle', self.callback_add_mask)
+        self._canvas.start_capture('circle', self.callback_add_mask,
+                                   is_exc=self.builder.get_object('exclude_points').get_active())
 
     def _add_new_rect_mask_clicked(self, widget):
-        self._canvas.start_capture('rect', self.callback_add_mask)
+        self._canvas.start_capture('rect', self.callback_add_mask,
+                                   is_exc=self.builder.get_object('exclude_points').get_active())
+
+    def _add_new_polygon_mask_clicked(self, widget):
+        self._canvas.start_capture('polygon', self.callback_add_mask,
+                                   is_exc=self.builder.get_object('exclude_points').get_active())
 
     # -------------------------------------------------------------------------------
     # Signal callback function
@@ -345,7 +359,7 @@ class S4SMainWindow(S4SBase.S4SBase):
 
             self.builder.get_object('load_file').set_stock_id(gtk.STOCK_MEDIA_PAUSE)
             self._enable_widgets(self._WIDGETS_ACTIVE_AFTER_LOADED, False)
-            self.processor.load_file(comment, separator, 0)
+            self.processor.load_file(comment=comment, separator=separator, skip_row=int(skip_row))
             self.tic()
         else:
             if self.toc() < 0.5:
@@ -135,8 +135,9 @@ class S4SPlotOptionsWindow(S4SBase.S4SBase):
         self._mask_table.show_all()
         self._is_open = False
 
-        # Setting the list of mask labels
-        labels = {'combobox_mask_labels': self.processor.get_mask_labels(),
+        # Setting the list of mask labels, the masks are added with default parameters so the polygon masks, drawn
+        # with the lasso on the canvas, are left out
+        labels = {'combobox_mask_labels': [l for l in self.processor.get_mask_labels() if l != 'Polygon'],
                   'plot_type_combo': plot_types,
                   'colormap_combo': colormaps,
                   'aspect_ratio_combo': aspect_ratio}
@@ -0,0 +1,134 @@
+__author__ = 'Musa Morena Marcusso Manhaes'
+
+import numpy as np
+
+
+class S4SBitMask(object):
+    # Number of set bits of each byte value
+    _POPCOUNT = np.array([bin(i).count('1') for i in range(256)], dtype=np.uint8)
+    _WORD_BITS = 64
+
+    def __init__(self, shape, words=None):
+        # Boolean matrix stored with one bit per element in 64-bit words, the bits after the last element are zero
+        self._shape = tuple(int(n) for n in np.atleast_1d(shape))
+        n_words = (self.size + self._WORD_BITS - 1) // self._WORD_BITS
+        if words is None:
+            words = np.zeros(n_words, dtype=np.uint64)
+        elif not isinstance(words, np.ndarray) or words.dtype != np.uint64 or words.shape != (n_words,):
+            raise ValueError('The words must be a uint64 array with %d elements' % n_words)
+        self._words = words
+
+    @classmethod
+    def from_dense(cls, array):
+        array = np.asarray(array, dtype=bool)
+        mask = cls(array.shape)
+        packed = np.packbits(array.ravel())
+        mask._words.view(np.uint8)[:packed.size] = packed
+        return mask
+
+    @classmethod
+    def ones(cls, shape):
+        return ~cls(shape)
+
+    @property
+    def shape(self):
+        return self._shape
+
+    @property
+    def size(self):
+        return int(np.prod(self._shape))
+
+    @property
+    def nbytes(self):
+        return self._words.nbytes
+
+    @property
+    def words(self):
+        return self._words
+
+    def to_dense(self):
+        return np.unpackbits(self._words.view(np.uint8))[:self.size].view(bool).reshape(self._shape)
+
+    def get_row_alignment(self):
+        # Number of rows whose bits fill whole words, row blocks starting at multiples of it can be set directly
+        n_cols = int(np.prod(self._shape[1:]))
+        return self._WORD_BITS // np.gcd(n_cols, self._WORD_BITS) if n_cols > 0 else 1
+
+    def set_rows(self, row, block):
+        # Pack a dense block of rows starting at a row multiple of get_row_alignment()
+        if row % self.get_row_alignment() != 0:
+            raise ValueError('The first row of the block must be a multiple of the row alignment')
+        block = np.asarray(block, dtype=bool)
+        if block.shape[1:] != self._shape[1:] or row + block.shape[0] > self._shape[0]:
+            raise ValueError('The block does not fit in the mask')
+        start = row * int(np.prod(self._shape[1:])) // 8
+        packed = np.packbits(block.ravel())
+        self._words.view(np.uint8)[start:start + packed.size] = packed
+
+    def get_rows(self, row, n_rows):
+        # Dense copy of a block of rows
+        n_cols = int(np.prod(self._shape[1:]))
+        start = row * n_cols
+        stop = min(row + n_rows, self._shape[0]) * n_cols
+        bits = np.unpackbits(self._words.view(np.uint8)[start // 8:(stop + 7) // 8])
+        return bits[start % 8:start % 8 + stop - start].view(bool).reshape((-1,) + self._shape[1:])
+
+    def get_row_range(self):
+        # First and one past the last row holding set bits, None if no bit is set
+        words = np.flatnonzero(self._words)
+        if words.size == 0:
+            return None
+        n_cols = max(int(np.prod(self._shape[1:])), 1)
+        first = int(words[0]) * self._WORD_BITS
+        last = int(words[-1]) * self._WORD_BITS + self._WORD_BITS - 1
+        return first // n_cols, min(last // n_cols + 1, self._shape[0])
+
+    def count(self):
+        return int(self._POPCOUNT[self._words.view(np.uint8)].sum(dtype=np.int64))
+
+    def any(self):
+        return bool(self._words.any())
+
+    def copy(self):
+        return S4SBitMask(self._shape, self._words.copy())
+
+    def _check(self, other):
+        if not isinstance(other, S4SBitMask):
+            raise TypeError('The operand must be a S4SBitMask')
+        if other.shape != self._shape:
+            raise ValueError('The masks must have the same shape')
+
+    def __and__(self, other):
+        self._check(other)
+        return S4SBitMask(self._shape, np.bitwise_and(self._words, other.words))
+
+    def __or__(self, other):
+        self._check(other)
+        return S4SBitMask(self._shape, np.bitwise_or(self._words, other.words))
+
+    def __iand__(self, other):
+        self._check(other)
+        np.bitwise_and(self._words, other.words, out=self._words)
+        return self
+
+    def __ior__(self, other):
+        self._check(other)
+        np.bitwise_or(self._words, other.words, out=self._words)
+        return self
+
+    def __invert__(self):
+        words = np.invert(self._words)
+        # Clear the padding bits of the last word
+        n_tail = self.size % self._WORD_BITS
+        if n_tail > 0:
+            tail = np.zeros(self._WORD_BITS, dtype=bool)
+            tail[:n_tail] = True
+            words[-1] &= np.packbits(tail).view(np.uint64)[0]
+        return S4SBitMask(self._shape, words)
+
+    def __eq__(self, other):
+        return isinstance(other, S4SBitMask) and other.shape == self._shape and \
+            np.array_equal(self._words, other.words)
+
+    def __ne__(self, other):
+        return not self.__eq__(other)
@@ -0,0 +1,101 @@
+__author__ = 'Musa Morena Marcusso Manhaes'
+
+import zlib
+import bz2
+
+try:
+    import lzma
+except ImportError:
+    try:
+        from backports import lzma
+    except ImportError:
+        lzma = None
+
+
+class S4SCompressedFile(object):
+    # Magic numbers at the beginning of each supported compressed format
+    _MAGIC = {'gzip': '\x1f\x8b',
+              'bz2': 'BZh',
+              'xz': '\xfd7zXZ\x00'}
+    # Number of compressed bytes fed to the decompressor at once
+    _INPUT_SIZE = 1024 * 1024
+
+    def __init__(self, filename):
+        compression = self.get_compression(filename)
+        if compression is None:
+            raise ValueError('File is not compressed or the compression is not supported, file=' + filename)
+        if compression == 'xz' and lzma is None:
+            raise ImportError('The lzma module is required to read xz files')
+
+        self._compression = compression
+        self._file_obj = open(filename, 'rb')
+        self._decompressor = self._new_decompressor()
+        self._output = ''
+        self._is_eof = False
+
+    @classmethod
+    def get_compression(cls, filename):
+        fid = open(filename, 'rb')
+        header = fid.read(max([len(m) for m in cls._MAGIC.values()]))
+        fid.close()
+        for key in cls._MAGIC:
+            if header.startswith(cls._MAGIC[key]):
+                return key
+        return None
+
+    @classmethod
+    def is_compressed(cls, filename):
+        return cls.get_compression(filename) is not None
+
+    @property
+    def compression(self):
+        return self._compression
+
+    @property
+    def compressed_position(self):
+        # Number of bytes read from the compressed file, used to report the progress
+        return self._file_obj.tell()
+
+    def read(self, size=-1):
+        while not self._is_eof and (size < 0 or len(self._output) < size):
+            self._decompress_next()
+
+        if size < 0 or size >= len(self._output):
+            output = self._output
+            self._output = ''
+        else:
+            output = self._output[:size]
+            self._output = self._output[size:]
+        return output
+
+    def close(self):
+        self._file_obj.close()
+
+    def _new_decompressor(self):
+        if self._compression == 'gzip':
+            return zlib.decompressobj(16 + zlib.MAX_WBITS)
+        elif self._compression == 'bz2':
+            return bz2.BZ2Decompressor()
+        return lzma.LZMADecompressor()
+
+    def _decompress_next(self):
+        data = self._file_obj.read(self._INPUT_SIZE)
+        if not data:
+            if self._compression == 'gzip':
+                self._output += self._decompressor.flush()
+            self._is_eof = True
+            return
+
+        while data:
+            try:
+                self._output += self._decompressor.decompress(data)
+            except EOFError:
+                # Decompressor reached the end of a stream that has trailing data
+                self._decompressor = self._new_decompressor()
+                continue
+            data = self._decompressor.unused_data
+            if data:
+                # Concatenated streams (e.g. multi-member gzip files) are decoded one after the other
+                if self._compression == 'gzip':
+                    self._output += self._decompressor.flush()
+                self._decompressor = self._new_decompressor()
@@ -1,15 +1,27 @@
 __author__ = 'Musa Morena Marcusso Manhaes'
 
 import os
+import hashlib
 from copy import deepcopy
 import numpy as np
-from scipy.optimize import leastsq
-from scipy.interpolate import griddata
+from scipy.spatial import cKDTree
 import datetime
-import re
 from time import time
+from threading import RLock
 import S4SMessageHandler
 import S4SMask
+import S4SBitMask
+import S4SMaskExpression
+import S4SParser
+import S4SParallelParser
+import S4SPointBuffer
+import S4SCompressedFile
+import S4SPointCache
+import S4SGridCache
+import S4SReader
+import S4SGridder
+import S4SPlaneFit
+import S4SFormFit
 
 
 def plane_eval(param, x, y):
@@ -22,6 +34,41 @@ def plane_eval(param, x, y):
 
 class S4SData(object):
     _MAX_POINTS = 200
+    # Minimum interval in seconds between two progress messages while loading a file
+    _PROGRESS_PERIOD = 1.0
+    # Files smaller than this are always parsed by a single process [bytes]
+    _PARALLEL_MIN_SIZE = 32 * 1024 * 1024
+    # Default maximum number of cells of the interpolated grid
+    _MAX_GRID_CELLS = 4000000
+    # Number of points used to measure the point spacing
+    _SPACING_SAMPLES = 50000
+    _SPACING_MIN_SAMPLES = 100
+    # Scans with more points than this are bin averaged when the interpolation method is 'auto'
+    _BIN_AVERAGE_MIN_POINTS = 2000000
+    # Average number of points per cell of a bin averaged grid when the grid pitch is not set, the nearest-neighbour
+    # spacing leaves most bins empty for scattered points
+    _BIN_POINTS_PER_CELL = 4
+    # Scans with less points than this are always interpolated in a single pass
+    _TILED_GRID_MIN_POINTS = 200000
+    # Maximum number of cells of the preview grid and minimum number of points averaged per preview cell
+    _PREVIEW_MAX_CELLS = 250 * 250
+    _PREVIEW_POINTS_PER_CELL = 4
+    # Masks whose XY bounding box covers more than this fraction of the point cloud are tested on all points
+    # instead of querying the KD-tree
+    _TREE_QUERY_MAX_AREA = 0.25
+    # Number of grid cells evaluated at once by a mask expression
+    _MASK_BLOCK_CELLS = 256 * 1024
+    # Methods to fit the reference plane, 'ransac' ignores outliers such as burrs, debris and holes
+    _PLANE_METHODS = ['least_squares', 'ransac']
+    # Number of selected points scored by the robust plane hypotheses, the bounds on the number of hypotheses and
+    # on the time spent generating them [s]
+    _RANSAC_SAMPLES = 20000
+    _RANSAC_MAX_ITERATIONS = 2000
+    _RANSAC_MAX_TIME = 0.5
+    # Number of grid cells of the reference form evaluated at once and number of points per axis of the displayed
+    # reference form
+    _FORM_BLOCK_CELLS = 1024 * 1024
+    _FORM_PLOT_POINTS = 20
 
     def __init__(self):
         self._details = {'filename': '',
@@ -51,10 +98,24 @@ class S4SData(object):
 
         self._comment = ''
 
-        # Filtering mask to remove points that are not needed for the analysis
+        # Filtering mask to remove points that are not needed for the analysis, stored as a S4SBitMask
         self._mask = None
-
+        # Points with a valid Z value, the combined mask is built from it and the cached result of each mask
+        self._valid = None
+        # Incremented every time the point coordinates change, invalidates the cached mask results
+        self._data_version = 0
+
+        # Incremented every time the combined mask changes
+        self._mask_version = 0
+        # Residual to the reference plane or form, computed on demand at full resolution or for the points displayed
+        # and tagged with the data, mask and reference parameters it was computed for
         self._color = None
+
+        self._color_key = None
+
+        self._color_sample = None
+
+        self._color_sample_key = None
         # Rotation angles (Euler's angles) to remove the tilt of the point cloud
         self._rot = np.array([0, 0, 0])
         # Translation vector regarding the center of mass
@@ -64,7 +125,33 @@ class S4SData(object):
 
         self._mask_index = 0
 
+        # Boolean expression combining the masks, if None the active masks are combined with AND
+        self._mask_expression = None
+        # Last result of the mask expression and the key of the expression, masks and data it was computed for
+        self._expression_result = None
+
+        self._expression_key = None
+
         self._plane_param = [0, 0, 0, 0]
+        # Maximum number of points used to fit the plane, larger selections are subsampled on a regular stride.
+        # None uses all selected points
+        self._plane_fit_max_points = None
+
+        self._plane_method = 'least_squares'
+        # Inlier threshold of the robust plane fit [mm], None derives it from the residuals
+        self._ransac_threshold = None
+        # Order of the polynomial surface removed as reference, 1 fits a plane
+        self._form_order = 1
+        # Fitted polynomial surface, None if the reference is a plane
+        self._form_fit = None
+        # Plane or polynomial fit holding the moments of the selection it was computed for and the key of the data
+        self._fit = None
+
+        self._fit_selection = None
+
+        self._fit_key = None
+        # Data version the reference plane or form was fitted for, the residual is only valid for this version
+        self._reference_version = None
 
         self._trans_range = [-100.0, 100.0]
 
@@ -80,17 +167,70 @@ class S4SData(object):
 
         self._uploaded_data = []
 
+        # Regular grid axes, the X and Y matrices are broadcast views of these axes and hold no memory
+        self._x_axis = None
+
+        self._y_axis = None
+
         self._x = None
 
         self._y = None
 
         self._z = None
 
+        # Store the interpolated Z values in single precision
+        self._use_float32 = False
+
+        # Interpolate the points to a regular grid, otherwise the raw points are used directly and indexed by
+        # a KD-tree in the XY plane
+        self._use_grid = True
+
+        self._tree = None
+        # Translation applied to the points after the KD-tree was built
+        self._tree_offset = np.zeros(2)
+        # Translation removed from the points by remove_offset, applied again every time the grid is generated from
+        # the loaded points
+        self._offset = np.zeros(3)
+
         self._thread_is_running = False
+        # Held while the grid or point arrays are swapped and while they are read for display, the loading thread
+        # replaces the preview grid while the callbacks of other threads may read it
+        self._data_lock = RLock()
+
+        # Store the parsed points and the grids in the cache directory
+        self._use_cache = True
+
+        self._grid_cache = S4SGridCache.S4SGridCache()
+        # Fingerprint of the loaded measurement file and parser options
+        self._source_key = None
+
+        # Interpolation method used to generate the grid, 'auto' uses bin averaging for very large scans
+        self._interp_method = 'auto'
+        self._gridder = S4SGridder.S4SGridder()
+
+        # Grid pitch [mm], None uses the measured nearest-neighbour spacing of the points
+        self._grid_pitch = None
+
+        self._max_grid_cells = self._MAX_GRID_CELLS
+
+        # Display a coarse grid while the full resolution grid is interpolated
+        self._use_preview = True
+
+        # Number of processes used to parse large measurement files and interpolate large grids by tiles,
+        # 1 runs everything in the loading thread
+        self._n_processes = 1
 
         self._message_handler = S4SMessageHandler.S4SMessageHandler.get_instance()
 
 
+    @classmethod
+    def get_interp_methods(cls):
+        return S4SGridder.S4SGridder.get_methods()
+
+    @classmethod
+    def get_binary_extensions(cls):
+        return S4SReader.S4SReader.get_extensions()
+
     @classmethod
     def get_mask_labels(cls):
         return S4SMask.S4SMask.get_mask_labels()
@@ -107,6 +247,10 @@ class S4SData(object):
     def get_range_mask_param_labels(cls):
         return S4SMask.S4SMask.get_range_mask_param_labels()
 
+    @classmethod
+    def get_polygon_mask_param_labels(cls):
+        return S4SMask.S4SMask.get_polygon_mask_param_labels()
+
     @property
     def label(self):
         return self._label
@@ -142,6 +286,150 @@ class S4SData(object):
     def is_data_loaded(self):
         return self._x is not None and self._y is not None and self._z is not None
 
+    @property
+    def use_cache(self):
+        return self._use_cache
+
+    @use_cache.setter
+    def use_cache(self, is_active):
+        if type(is_active) is not bool:
+            raise TypeError
+        self._use_cache = is_active
+
+    @property
+    def interp_method(self):
+        return self._interp_method
+
+    @interp_method.setter
+    def interp_method(self, method):
+        if method != 'auto' and method not in S4SGridder.S4SGridder.get_methods():
+            raise ValueError('Invalid interpolation method, method=' + str(method))
+        self._interp_method = method
+
+    @property
+    def use_float32(self):
+        return self._use_float32
+
+    @use_float32.setter
+    def use_float32(self, is_active):
+        if type(is_active) is not bool:
+            raise TypeError
+        self._use_float32 = is_active
+
+    @property
+    def use_grid(self):
+        return self._use_grid
+
+    @use_grid.setter
+    def use_grid(self, is_active):
+        if type(is_active) is not bool:
+            raise TypeError
+        self._use_grid = is_active
+
+    @property
+    def is_gridless(self):
+        return self._x_axis is None and self._tree is not None
+
+    @property
+    def use_preview(self):
+        return self._use_preview
+
+    @use_preview.setter
+    def use_preview(self, is_active):
+        if type(is_active) is not bool:
+            raise TypeError
+        self._use_preview = is_active
+
+    @property
+    def grid_pitch(self):
+        return self._grid_pitch
+
+    @grid_pitch.setter
+    def grid_pitch(self, pitch):
+        if pitch is not None and pitch <= 0:
+            raise ValueError('The grid pitch must be greater than zero')
+        self._grid_pitch = None if pitch is None else float(pitch)
+
+    @property
+    def max_grid_cells(self):
+        return self._max_grid_cells
+
+    @max_grid_cells.setter
+    def max_grid_cells(self, n_cells):
+        if n_cells < 4:
+            raise ValueError('The grid must have at least 2 x 2 cells')
+        self._max_grid_cells = int(n_cells)
+
+    @property
+    def n_processes(self):
+        return self._n_processes
+
+    @n_processes.setter
+    def n_processes(self, n):
+        if type(n) is not int:
+            raise TypeError('The number of processes must be an integer')
+        if n < 1:
+            raise ValueError('The number of processes must be greater than zero')
+        self._n_processes = n
+
+    @classmethod
+    def get_plane_methods(cls):
+        return cls._PLANE_METHODS
+
+    @property
+    def plane_method(self):
+        return self._plane_method
+
+    @plane_method.setter
+    def plane_method(self, method):
+        if method not in self._PLANE_METHODS:
+            raise ValueError('Invalid plane fitting method, method=' + str(method))
+        self._plane_method = method
+
+    @property
+    def ransac_threshold(self):
+        return self._ransac_threshold
+
+    @ransac_threshold.setter
+    def ransac_threshold(self, threshold):
+        if threshold is not None and threshold <= 0:
+            raise ValueError('The inlier threshold must be greater than zero')
+        self._ransac_threshold = None if threshold is None else float(threshold)
+
+    @classmethod
+    def get_form_orders(cls):
+        return S4SFormFit.S4SFormFit.get_orders()
+
+    @property
+    def form_order(self):
+        return self._form_order
+
+    @form_order.setter
+    def form_order(self, order):
+        if type(order) is not int:
+            raise TypeError('The order of the reference form must be an integer')
+        if order not in self.get_form_orders():
+            raise ValueError('Invalid order of the reference form, order=' + str(order))
+        self._form_order = order
+
+    @property
+    def plane_fit_max_points(self):
+        return self._plane_fit_max_points
+
+    @plane_fit_max_points.setter
+    def plane_fit_max_points(self, n_points):
+        if n_points is not None and n_points < 3:
+            raise ValueError('At least three points are needed to fit a plane')
+        self._plane_fit_max_points = None if n_points is None else int(n_points)
+
+    @property
+    def grid_cache_size(self):
+        return self._grid_cache.max_size
+
+    @grid_cache_size.setter
+    def grid_cache_size(self, new_size):
+        self._grid_cache.max_size = new_size
+
     @property
     def always_remove_offset(self):
         return self._always_remove_offset
@@ -183,7 +471,7 @@ class S4SData(object):
     @property
     def step(self):
         if self._step == 0 and self._x is not None:
-            self._step = np.fix(np.min([self._x.shape[0], self._x.shape[1]]) / self._MAX_POINTS)
+            self._step = int(np.min([self._x.shape[0], self._x.shape[1]]) / self._MAX_POINTS)
             if self._step == 0:
                 self._step = 1
         return self._step
@@ -229,7 +517,8 @@ class S4SData(object):
     def range_x(self):
         if self._x is not None and self._y is not None and self._z is not None:
             mask = self._get_mask()
-            return [self._x[mask].min(), self._x[mask].max()]
+            x = self._x[mask] if self._x_axis is None else self._x_axis[np.any(mask, axis=0)]
+            return [x.min(), x.max()]
         else:
             return [-1, -1]
 
@@ -237,7 +526,8 @@ class S4SData(object):
     def range_y(self):
         if self._x is not None and self._y is not None and self._z is not None:
             mask = self._get_mask()
-            return [self._y[mask].min(), self._y[mask].max()]
+            y = self._y[mask] if self._y_axis is None else self._y_axis[np.any(mask, axis=1)]
+            return [y.min(), y.max()]
         else:
             return [-1, -1]
 
@@ -256,7 +546,8 @@ class S4SData(object):
                 return self.range_z
             else:
                 mask = self._get_mask()
-                return [self._color[mask].min(), self._color[mask].max()]
+                color = self.calc_color()
+                return [color[mask].min(), color[mask].max()]
         else:
             return [-1, -1]
 
@@ -266,6 +557,10 @@ class S4SData(object):
 
     @property
     def data(self):
+        with self._data_lock:
+            return self._get_data()
+
+    def _get_data(self):
         if self._x is not None:
             if self._always_remove_offset:
                 self.calc_center_of_mass()
@@ -273,25 +568,45 @@ class S4SData(object):
             else:
                 cm = [0.0, 0.0, 0.0]
 
-            z = deepcopy(self._z)
-            if np.count_nonzero(self._mask) == 0:
+            if not self._mask.any():
                 self.disable_all_masks()
 
-            z[np.logical_not(self._mask)] = np.nan
-
-            return self._x[::self._step, ::self._step] - cm[0], \
-                   self._y[::self._step, ::self._step] - cm[1], \
-                   z[::self._step, ::self._step] - cm[2], \
-                   self._color[::self._step, ::self._step] if self._use_plane else self._z[::self._step, ::self._step]
+            if self._x_axis is None:
+                # Raw points are decimated by keeping one selected point per cell of a coarse XY grid
+                index = self._get_sample_index()
+                return self._x[index] - cm[0], \
+                       self._y[index] - cm[1], \
+                       self._z[index] - cm[2], \
+                       self._get_color_sample(index=index) if self._use_plane else self._z[index]
+
+            # Only the decimated grid is copied
+            step = int(self._step)
+            z = np.array(self._z[::step, ::step])
+            z[np.logical_not(self._mask.to_dense()[::step, ::step])] = np.nan
+
+            return self._x[::step, ::step] - cm[0], \
+                   self._y[::step, ::step] - cm[1], \
+                   z - cm[2], \
+                   self._get_color_sample(step) if self._use_plane else self._z[::step, ::step]
         else:
             return None, None, None, None
 
     @property
     def plane(self):
+        with self._data_lock:
+            return self._get_plane()
+
+    def _get_plane(self):
         if self._x is not None and self._use_plane:
-            mask = self._get_mask()
-            x, y = np.meshgrid([self._x[mask].min() - 0.2, self._x[mask].max() + 0.2],
-                               [self._y[mask].min() - 0.2, self._y[mask].max() + 0.2])
+            self._update_reference()
+            range_x = self.range_x
+            range_y = self.range_y
+            x, y = np.meshgrid([range_x[0] - 0.2, range_x[1] + 0.2],
+                               [range_y[0] - 0.2, range_y[1] + 0.2])
+            if self._form_fit is not None:
+                x, y = np.meshgrid(np.linspace(range_x[0] - 0.2, range_x[1] + 0.2, self._FORM_PLOT_POINTS),
+                                   np.linspace(range_y[0] - 0.2, range_y[1] + 0.2, self._FORM_PLOT_POINTS))
+                return x, y, self._form_fit.eval_points(x, y)
             plane = np.ones(shape=x.shape)
             for i in range(plane.shape[0]):
                 for j in range(plane.shape[1]):
@@ -300,6 +615,23 @@ class S4SData(object):
         else:
             return None
 
+    @property
+    def mask_expression(self):
+        return self._mask_expression
+
+    @mask_expression.setter
+    def mask_expression(self, expression):
+        if expression is not None:
+            expression = S4SMaskExpression.S4SMaskExpression.from_tuple(expression)
+            missing = [i for i in expression.get_mask_indexes() if i not in self._masks]
+            if len(missing) > 0:
+                raise ValueError('Invalid mask indexes in the expression, indexes=' + str(missing))
+        self._mask_expression = expression
+        self._expression_result = None
+        self._has_mask_changed = True
+        if self._mask is not None:
+            self.update_mask()
+
     @property
     def center_of_mass(self):
         self.calc_center_of_mass()
@@ -307,10 +639,8 @@ class S4SData(object):
 
     def _get_mask(self):
         self.update_mask()
-        self._step = np.fix(np.max([self._x.shape[0], self._x.shape[1]]) / self._MAX_POINTS)
-        if self._step < 1:
-            self._step = 1
-        mask = np.logical_and(self._mask, np.logical_not(np.isnan(self._z)))
+        self._step = max(int(np.max([self._x.shape[0], self._x.shape[1]]) / self._MAX_POINTS), 1)
+        mask = np.logical_and(self._mask.to_dense(), np.logical_not(np.isnan(self._z)))
         if np.count_nonzero(mask) == 0:
             self.disable_all_masks()
             mask = np.logical_not(np.isnan(self._z))
@@ -325,6 +655,7 @@ class S4SData(object):
     def reset_filters(self):
         self._masks = {}
         self._mask_index = 0
+        self._mask_expression = None
         self._has_mask_changed = True
         self.update_mask()
 
@@ -342,11 +673,13 @@ class S4SData(object):
         return self._masks.keys()
 
     def disable_all_masks(self):
-        if np.count_nonzero(self._mask) == 0:
+        if not self._mask.any():
             if len(self._masks.keys()) > 0:
                 for key in self._masks:
                     self._masks[key].is_active = False
-            self._mask = np.logical_not(np.isnan(self._z))
+            self._mask_expression = None
+            self._mask = S4SBitMask.S4SBitMask.from_dense(np.logical_not(np.isnan(self._z)))
+            self._mask_version += 1
 
     def add_circle_mask(self, radius, center, plan, is_exc):
         try:
@@ -364,20 +697,192 @@ class S4SData(object):
             return -1
 
     def calc_color(self):
-        self._color = np.ones(shape=self._z.shape)
-        self._color = self._z - (-self._plane_param[3] - self._plane_param[0] * self._x - self._plane_param[1] *
-                               self._y) / self._plane_param[2]
-        self._color[np.logical_not(self._mask)] = np.nan
+        # Full resolution residual, the points outside the mask are NaN
+        key = self._get_color_key()
+        if self._color is None or self._color_key != key:
+            self._color = self._get_reference_residual()
+            self._color[np.logical_not(self._mask.to_dense())] = np.nan
+            self._color_key = key
+        return self._color
+
+    def _get_color_sample(self, step=1, index=None):
+        # Residual of the decimated grid or of the sampled raw points only, the sampled points depend on the mask
+        key = (self._get_color_key(), step)
+        if self._color is not None and self._color_key == key[0]:
+            return self._color[::step, ::step] if index is None else self._color[index]
+        if self._color_sample is None or self._color_sample_key != key:
+            if index is None:
+                self._color_sample = self._get_reference_residual(step)
+                self._color_sample[np.logical_not(self._mask.to_dense()[::step, ::step])] = np.nan
+            else:
+                self._color_sample = self._get_reference_residual(index=index)
+            self._color_sample_key = key
+        return self._color_sample
+
+    def _update_reference(self):
+        # The reference is fitted again if the coordinates changed since the last fit, e.g. by remove_offset
+        if self._reference_version != self._data_version:
+            self.calc_fitting_plane()
+
+    def _get_color_key(self):
+        self._update_reference()
+        if self._form_fit is not None:
+            reference = self._form_fit.get_param_key()
+        else:
+            reference = tuple(self._plane_param)
+        return self._data_version, self._mask_version, reference
+
+    def _get_reference_residual(self, step=1, index=None):
+        if self._form_fit is not None:
+            return self._get_form_residual(self._form_fit, step, index)
+        return self._get_plane_residual(self._plane_param, step, index)
+
+    def _get_plane_residual(self, param, step=1, index=None):
+        # Residual of the grid decimated by step or of the raw points with the given indexes
+        if self._x_axis is None:
+            if index is None:
+                index = slice(None)
+            z = self._z[index]
+            return z - plane_eval(param, self._x[index], self._y[index]).reshape(z.shape).astype(z.dtype)
+        # The plane is evaluated on the 1-D axes and broadcast, only the residual is allocated at full size
+        plane_x = (-param[3] - param[0] * self._x_axis[::step]) / param[2]
+        plane_y = -param[1] * self._y_axis[::step] / param[2]
+        residual = self._z[::step, ::step] - plane_x.astype(self._z.dtype)[np.newaxis, :]
+        residual -= plane_y.astype(self._z.dtype)[:, np.newaxis]
+        return residual
+
+    def _get_form_residual(self, fit, step=1, index=None):
+        if index is not None:
+            return self._z[index] - fit.eval_points(self._x[index], self._y[index]).astype(self._z.dtype)
+        # The polynomial surface is evaluated by blocks of rows, only the residual is allocated at full size
+        z = self._z[::step, ::step]
+        residual = np.empty(z.shape, dtype=z.dtype)
+        n_rows = max(self._FORM_BLOCK_CELLS / max(z.shape[1], 1), 1)
+        for i0 in range(0, z.shape[0], n_rows):
+            i1 = min(i0 + n_rows, z.shape[0])
+            if self._x_axis is not None:
+                surface = fit.eval_grid(self._x_axis[::step], self._y_axis[::step][i0:i1])
+            else:
+                surface = fit.eval_points(self._x[i0:i1], self._y[i0:i1])
+            np.subtract(z[i0:i1], surface, out=residual[i0:i1], casting='unsafe')
+        return residual
+
+    def _new_fit(self, mask, step):
+        # Plane or polynomial surface holding the moments of the selected points, the polynomial is scaled to the XY
+        # bounds of the selection
+        if self._x_axis is not None:
+            if self._form_order > 1:
+                x = self._x_axis[np.any(mask, axis=0)]
+                y = self._y_axis[np.any(mask, axis=1)]
+                fit = S4SFormFit.S4SFormFit(self._form_order, [x.min(), x.max()], [y.min(), y.max()])
+            else:
+                fit = S4SPlaneFit.S4SPlaneFit(((self._x_axis[0] + self._x_axis[-1]) / 2.0,
+                                               (self._y_axis[0] + self._y_axis[-1]) / 2.0))
+            fit.add_grid(self._x_axis[::step], self._y_axis[::step], self._z[::step, ::step], mask[::step, ::step])
+        else:
+            index = np.flatnonzero(mask)[::step * step]
+            x = self._x.ravel()[index]
+            y = self._y.ravel()[index]
+            if self._form_order > 1:
+                fit = S4SFormFit.S4SFormFit(self._form_order, [x.min(), x.max()], [y.min(), y.max()])
+            else:
+                fit = S4SPlaneFit.S4SPlaneFit((x.mean(), y.mean()))
+            fit.add_points(x, y, self._z.ravel()[index])
+        return fit
+
+    def _update_fit(self, fit, selection, weight):
+        # Add or remove the moments of the selected points, only the rows and columns holding them are visited
+        rows = selection.get_row_range()
+        if rows is None:
+            return
+        mask = selection.get_rows(rows[0], rows[1] - rows[0])
+        if self._x_axis is not None:
+            cols = np.flatnonzero(np.any(mask, axis=0))
+            cols = slice(cols[0], cols[-1] + 1)
+            fit.add_grid(self._x_axis[cols], self._y_axis[rows[0]:rows[1]], self._z[rows[0]:rows[1], cols],
+                         mask[:, cols], weight)
+        else:
+            index = rows[0] + np.flatnonzero(mask)
+            fit.add_points(self._x.ravel()[index], self._y.ravel()[index], self._z.ravel()[index], weight)
+
+    def _get_fit(self, mask, step, selection=None):
+        # The moments are kept for the current mask, given as selection. If only the mask changed since the last
+        # fit, the points that entered or left the selection are added or removed instead of fitting all points.
+        # Removing more points than are left would lose the precision of the remaining moments, they are fitted again
+        key = (self._data_version, self._form_order)
+        is_incremental = False
+        if selection is not None and step == 1 and self._fit is not None and self._fit_key == key:
+            added = selection & ~self._fit_selection
+            removed = self._fit_selection & ~selection
+            is_incremental = added.count() + removed.count() <= selection.count()
+        if is_incremental:
+            self._update_fit(self._fit, added, 1.0)
+            self._update_fit(self._fit, removed, -1.0)
+        else:
+            self._fit = self._new_fit(mask, step)
+        if selection is not None and step == 1:
+            self._fit_key = key
+            self._fit_selection = selection.copy()
+        else:
+            self._fit_key = None
+            self._fit_selection = None
+        return self._fit
+
+    def _fit_robust_plane(self, mask):
+        # Robust plane from a random subsample of the selected points, returns the plane and the inlier threshold
+        random_state = np.random.RandomState(0)
+        index = np.flatnonzero(mask)
+        if index.size > self._RANSAC_SAMPLES:
+            index = random_state.choice(index, self._RANSAC_SAMPLES, replace=False)
+        if self._x_axis is not None:
+            rows, cols = np.unravel_index(index, mask.shape)
+            x = self._x_axis[cols]
+            y = self._y_axis[rows]
+        else:
+            x = self._x.ravel()[index]
+            y = self._y.ravel()[index]
+        return S4SPlaneFit.S4SPlaneFit.fit_ransac(x, y, self._z.ravel()[index],
+                                                  threshold=self._ransac_threshold,
+                                                  max_iterations=self._RANSAC_MAX_ITERATIONS,
+                                                  max_time=self._RANSAC_MAX_TIME,
+                                                  random_state=random_state)
 
     def calc_fitting_plane(self):
         mask = self._get_mask()
-        param = leastsq(lambda x: self._z[mask].flatten() - plane_eval(x, self._x[mask], self._y[mask]),
-                        [1, 1, 1, 1],
-                        full_output=True)
-        self._plane_param = param[0]
-        self._message_handler.push_message('Data', 'info', 'New parameters for the fitting plane calculated!')
+        # The moments of the current mask are updated incrementally, see _get_fit
+        selection = self._mask
+        # The robust fit is only available for the plane, polynomial forms are fitted on all selected points
+        if self._plane_method == 'ransac' and self._form_order == 1:
+            param, threshold = self._fit_robust_plane(mask)
+            # The least-squares fit below is refined on the inliers of the robust plane
+            with np.errstate(invalid='ignore'):
+                inliers = np.logical_and(mask, np.abs(self._get_plane_residual(param)) <= threshold)
+            self._message_handler.push_message('Data', 'info', 'Robust plane fitted, inliers = %.1f%%, '
+                                                               'threshold = %.3g mm'
+                                               % (100.0 * np.count_nonzero(inliers) / max(np.count_nonzero(mask), 1),
+                                                  threshold))
+            if np.count_nonzero(inliers) >= 3:
+                mask = inliers
+                selection = None
+        n_selected = np.count_nonzero(mask)
+        # Stride of the stratified subsample, every step-th row and column of the grid
+        step = 1
+        if self._plane_fit_max_points is not None and n_selected > self._plane_fit_max_points:
+            step = int(np.ceil(np.sqrt(n_selected / float(self._plane_fit_max_points))))
+
+        fit = self._get_fit(mask, step, selection)
+        if self._form_order > 1:
+            fit.solve()
+            self._form_fit = fit
+            self._reference_version = self._data_version
+            self._message_handler.push_message('Data', 'info', 'New parameters for the reference form calculated, '
+                                                               'order = %d' % self._form_order)
+            return True
 
-        self.calc_color()
+        self._form_fit = None
+        self._plane_param = fit.solve()
+        self._reference_version = self._data_version
+        self._message_handler.push_message('Data', 'info', 'New parameters for the fitting plane calculated!')
         return True
 
     def add_rect_mask(self, low_point, upper_point, is_exc):
@@ -398,6 +903,7 @@ class S4SData(object):
     def delete_all_masks(self):
         del self._masks
         self._masks = {}
+        self._mask_expression = None
         self._has_mask_changed = True
         self.update_mask()
 
@@ -416,6 +922,60 @@ class S4SData(object):
         except [ValueError, TypeError, AttributeError]:
             return -1
 
+    def add_polygon_mask(self, vertices, is_exc):
+        try:
+            # Create new polygonal mask with the given vertices in the XY plane
+            new_mask = S4SMask.S4SMask(id_number=self._mask_index, is_exc=is_exc)
+            new_mask.set_polygon_param(vertices)
+            # Add the new mask to the list
+            self._masks[self._mask_index] = new_mask
+            self._mask_index += 1
+            # Update the data mask
+            self._has_mask_changed = True
+            self.update_mask()
+            return self._mask_index - 1
+        except [ValueError, TypeError, AttributeError]:
+            return -1
+
+    def preview_mask(self, mask_type, points, is_exc, x, y, z):
+        # Evaluate a candidate mask on the given points without adding it, e.g. on the decimated data while the
+        # mask is drawn. The points are given as [center, radius] for circles, [lower, upper] for rectangles and
+        # as the list of vertices for polygons
+        new_mask = S4SMask.S4SMask(id_number=self._mask_index, is_exc=is_exc)
+        try:
+            if mask_type == 'circle':
+                new_mask.set_circle_param(float(points[1]), [float(points[0][0]), float(points[0][1]), 0.0], 'xy')
+            elif mask_type == 'rect':
+                new_mask.set_rect_param(list(points[0]), list(points[1]))
+            elif mask_type == 'polygon':
+                new_mask.set_polygon_param(points)
+            else:
+                return None
+        except (ValueError, TypeError):
+            return None
+        axes = self._get_preview_axes(x, y)
+        if axes is not None:
+            # The decimated grid is tested by windows, e.g. polygons are rasterized instead of testing each edge
+            return new_mask.test_grid(axes[0], axes[1], z)
+        return new_mask.test_point(x, y, z)
+
+    @staticmethod
+    def _get_preview_axes(x, y):
+        # Ascending 1-D axes of the X and Y matrices if they form a regular grid, None otherwise. The coordinates of
+        # the points that are not plotted may be NaN
+        if x.ndim != 2 or x.shape != y.shape or x.shape[0] < 2 or x.shape[1] < 2:
+            return None
+        with np.errstate(invalid='ignore'):
+            x_axis = np.fmax.reduce(x, axis=0)
+            y_axis = np.fmax.reduce(y, axis=1)
+            if np.any(np.isnan(x_axis)) or np.any(np.isnan(y_axis)) or \
+                    np.any(np.diff(x_axis) <= 0) or np.any(np.diff(y_axis) <= 0):
+                return None
+            if not np.all(np.logical_or(x == x_axis[np.newaxis, :], np.isnan(x))) or \
+                    not np.all(np.logical_or(y == y_axis[:, np.newaxis], np.isnan(y))):
+                return None
+        return x_axis, y_axis
+
     def set_mask_param(self, index, label, new_value):
         if index not in self._masks:
             return False
@@ -429,25 +989,90 @@ class S4SData(object):
             self._message_handler.push_message('Data', 'error', 'The data matrix was not initialized')
             raise ValueError('The data matrix was not initialized')
 
-        self._mask = np.logical_not(np.isnan(self._z))
+        if self._valid is None:
+            self._valid = S4SBitMask.S4SBitMask.from_dense(np.logical_not(np.isnan(self._z)))
+        self._mask = self._valid.copy()
+        self._mask_version += 1
 
-        if len(self._masks.keys()):
+        if self._mask_expression is not None:
+            self._mask &= self._get_expression_mask()
+        elif len(self._masks.keys()):
             for key in self._masks:
                 mask = self._masks[key]
                 if not mask.is_active:
                     continue
-                self._mask = np.logical_and(self._mask, mask.test_point(self._x, self._y, deepcopy(self._z)))
+                # Only the masks whose parameters changed since their last evaluation are tested again
+                result = mask.get_cached_result(self._data_version)
+                if result is None:
+                    result = S4SBitMask.S4SBitMask.from_dense(self._test_mask(mask))
+                    mask.set_cached_result(result, self._data_version)
+                self._mask &= result
 
         self._has_mask_changed = False
         if self._use_plane:
             self.calc_fitting_plane()
 
-        if np.count_nonzero(self._mask) == 0:
+        if not self._mask.any():
             self.disable_all_masks()
 
         self._message_handler.push_message('Data', 'info', 'Mask updated')
         return True
 
+    def _get_expression_mask(self):
+        indexes = sorted(self._mask_expression.get_mask_indexes())
+        key = (self._data_version, self._mask_expression.to_tuple(),
+               tuple([self._masks[i].get_param_key() for i in indexes]))
+        if self._expression_result is not None and self._expression_key == key:
+            return self._expression_result
+
+        # The whole expression is evaluated block by block of rows, the intermediate arrays have the block size
+        evaluate = self._mask_expression.compile()
+        result = S4SBitMask.S4SBitMask(self._z.shape)
+        align = result.get_row_alignment()
+        n_rows = max(self._MASK_BLOCK_CELLS / max(self._z.shape[1], 1) / align, 1) * align
+        for i0 in range(0, self._z.shape[0], n_rows):
+            i1 = min(i0 + n_rows, self._z.shape[0])
+            if self._x_axis is not None:
+                get_leaf = lambda i: self._masks[i].test_grid(self._x_axis, self._y_axis[i0:i1], self._z[i0:i1])
+            else:
+                get_leaf = lambda i: self._masks[i].test_point(self._x[i0:i1], self._y[i0:i1], self._z[i0:i1])
+            result.set_rows(i0, evaluate(get_leaf))
+
+        self._expression_result = result
+        self._expression_key = key
+        return result
+
+    def _test_mask(self, mask):
+        if self._x_axis is not None:
+            return mask.test_grid(self._x_axis, self._y_axis, self._z)
+        bounds = mask.get_xy_bounds() if self._tree is not None else None
+        if bounds is not None:
+            x_min, x_max, y_min, y_max = bounds
+            cloud = self._tree.maxes - self._tree.mins
+            if (x_max - x_min) * (y_max - y_min) < self._TREE_QUERY_MAX_AREA * cloud[0] * cloud[1]:
+                # Only the points inside the circle around the bounding box are tested, all others are outside
+                center = [(x_min + x_max) / 2.0 - self._tree_offset[0], (y_min + y_max) / 2.0 - self._tree_offset[1]]
+                index = np.array(self._tree.query_ball_point(center, np.hypot(x_max - x_min, y_max - y_min) / 2.0),
+                                 dtype=np.intp)
+                test = np.empty(self._z.shape, dtype=bool)
+                test.fill(mask.is_excluding)
+                if index.size > 0:
+                    test[index] = mask.test_point(self._x[index], self._y[index], self._z[index])
+                return test
+        return mask.test_point(self._x, self._y, self._z)
+
+    def _get_sample_index(self):
+        # Indexes of the selected points keeping at most one point per cell of a _MAX_POINTS x _MAX_POINTS grid
+        index = np.flatnonzero(self._mask.to_dense())
+        if index.size <= self._MAX_POINTS * self._MAX_POINTS:
+            return index
+        x = self._x[index, 0]
+        y = self._y[index, 0]
+        n = self._MAX_POINTS
+        cell_x = np.minimum((x - x.min()) * n / max(x.max() - x.min(), 1e-12), n - 1).astype(np.intp)
+        cell_y = np.minimum((y - y.min()) * n / max(y.max() - y.min(), 1e-12), n - 1).astype(np.intp)
+        return index[np.unique(cell_y * n + cell_x, return_index=True)[1]]
+
     def get_rotation_matrix(self):
         pass
 
@@ -481,8 +1106,14 @@ class S4SData(object):
         if self._x is None or self._y is None or self._z is None or self._mask is None:
             raise TypeError('No data has been loaded yet')
         mask = self._get_mask()
-        self._details['center_of_mass'][0] = self._x[mask].mean()
-        self._details['center_of_mass'][1] = self._y[mask].mean()
+        if self._x_axis is None:
+            self._details['center_of_mass'][0] = self._x[mask].mean()
+            self._details['center_of_mass'][1] = self._y[mask].mean()
+        else:
+            # Weighted means of the axes by the number of selected cells per column and row
+            n_selected = float(np.count_nonzero(mask))
+            self._details['center_of_mass'][0] = np.dot(np.count_nonzero(mask, axis=0), self._x_axis) / n_selected
+            self._details['center_of_mass'][1] = np.dot(np.count_nonzero(mask, axis=1), self._y_axis) / n_selected
         self._details['center_of_mass'][2] = self._z[mask].mean()
 
     def remove_offset(self):
@@ -490,9 +1121,17 @@ class S4SData(object):
             return False
         self.calc_center_of_mass()
 
-        self._x -= self._details['center_of_mass'][0]
-        self._y -= self._details['center_of_mass'][1]
+        if self._x_axis is None:
+            self._x -= self._details['center_of_mass'][0]
+            self._y -= self._details['center_of_mass'][1]
+            self._tree_offset -= self._details['center_of_mass'][0:2]
+        else:
+            # The X and Y matrices are views of the axes and follow the translation
+            self._x_axis -= self._details['center_of_mass'][0]
+            self._y_axis -= self._details['center_of_mass'][1]
         self._z -= self._details['center_of_mass'][2]
+        self._offset += self._details['center_of_mass']
+        self._data_version += 1
 
         self.calc_center_of_mass()
         return True
@@ -524,15 +1163,19 @@ class S4SData(object):
         ini_file = file_parts[0] + '.ini'
         return ini_file
 
-    def get_npz_file(self):
+    def get_cache_file(self):
         if not os.path.isdir(self._details['dir']):
             return False
         if not os.path.isfile(os.path.join(self._details['dir'], self._details['filename'])):
             return False
 
-        file_parts = self._details['filename'].split('.')
-        npz_file = file_parts[0] + '.npz'
-        return npz_file
+        # Uncompressed .npy instead of .npz so the cached points can be memory mapped. The points are stored in the
+        # cache directory next to the grids, named after the full path of the measurement so scan.1.asc and
+        # scan.2.asc or scans with the same name in different directories do not share the cache. The dots are
+        # replaced so the name does not end up listed as a measurement file
+        data_file = os.path.abspath(os.path.join(self._details['dir'], self._details['filename']))
+        return os.path.join(self._grid_cache.cache_dir, self._details['filename'].replace('.', '_') + '_' +
+                            hashlib.sha1(data_file).hexdigest()[:16] + '.npy')
 
     def ini_file_exists(self):
         if not os.path.isdir(self._details['dir']):
@@ -573,7 +1216,333 @@ class S4SData(object):
 
         return True
 
-    def open_file(self, comments='#', separator=' ', skip_row=0, callback_fcn=[]):
+    def _get_point_cache(self):
+        if not self._use_cache or not self.get_cache_file():
+            return None
+        return S4SPointCache.S4SPointCache(self.get_cache_file())
+
+    def _load_cached_points(self, parser, data_file):
+        cache = self._get_point_cache()
+        if cache is None:
+            return None
+        points = cache.load(S4SPointCache.S4SPointCache.get_key(data_file, parser))
+        if points is not None:
+            self._message_handler.push_message('Data', 'info', 'Points loaded from cache, file=' +
+                                               os.path.basename(cache.cache_file))
+        return points
+
+    def _store_cached_points(self, parser, data_file, points):
+        cache = self._get_point_cache()
+        if cache is None or points.shape[0] == 0:
+            return
+        try:
+            cache.store(points, S4SPointCache.S4SPointCache.get_key(data_file, parser))
+        except (IOError, OSError), e:
+            self._message_handler.push_message('Data', 'warning', 'Cannot write the point cache, error=' + str(e))
+
+    def _generate_grid(self, preview_fcn=[], is_running=None):
+        # Returns False if the loading thread was stopped, is_running is a function returning False once the
+        # loading thread was asked to stop. The preview grid, if shown, is kept
+        if not self._use_grid:
+            self._set_points()
+            return True
+
+        method = self.get_grid_method()
+        x_axis, y_axis = self._get_grid_axes(method)
+
+        z = self._load_cached_grid(x_axis, y_axis, method)
+        if z is None:
+            if len(preview_fcn) > 0 and self._use_preview and method != 'bin_average' and \
+                    len(x_axis) * len(y_axis) > self._PREVIEW_MAX_CELLS:
+                self._show_preview(x_axis, y_axis, preview_fcn)
+                if is_running is not None and not is_running():
+                    return False
+            z = self._interpolate_grid(x_axis, y_axis, method, is_running)
+            # Building the interpolator cannot be interrupted, the grid is discarded if a stop was requested meanwhile
+            if z is None or (is_running is not None and not is_running()):
+                return False
+
+        self._set_grid(x_axis, y_axis, z)
+        return True
+
+    def _get_grid_axes(self, method):
+        min_x, max_x, min_y, max_y = self._set_point_ranges()
+
+        pitch = self._grid_pitch
+        if pitch is None:
+            pitch = self.calc_point_spacing()
+            if method == 'bin_average':
+                # Pitch from the point density so each bin collects about _BIN_POINTS_PER_CELL points
+                density_pitch = np.sqrt((max_x - min_x) * (max_y - min_y) * self._BIN_POINTS_PER_CELL /
+                                        float(len(self._uploaded_data)))
+                pitch = max(pitch, density_pitch)
+        num_x, num_y = self._get_grid_size(max_x - min_x, max_y - min_y, pitch)
+
+        self._message_handler.push_message('Data', 'info', 'Grid pitch = %.4g mm, grid size = %d x %d'
+                                           % (pitch, num_x, num_y))
+
+        return np.linspace(min_x, max_x, num_x), np.linspace(min_y, max_y, num_y)
+
+    def _set_point_ranges(self):
+        # Store the ranges of the loaded points in the details dictionary, returns the XY bounds
+        min_x = self._uploaded_data[:, 0].min()
+        max_x = self._uploaded_data[:, 0].max()
+        min_y = self._uploaded_data[:, 1].min()
+        max_y = self._uploaded_data[:, 1].max()
+        min_z = self._uploaded_data[:, 2].min()
+        max_z = self._uploaded_data[:, 2].max()
+
+        self._details['range_x'] = max_x - min_x
+        self._details['range_y'] = max_y - min_y
+        self._details['range_z'] = max_z - min_z
+        return min_x, max_x, min_y, max_y
+
+    def _set_points(self):
+        # Use the raw points without interpolation, stored as (N, 1) matrices so the mask, range and plane
+        # methods handle them like a grid
+        start = time()
+        self._set_point_ranges()
+        x = np.array(self._uploaded_data[:, 0:1], dtype=np.float64) - self._offset[0]
+        y = np.array(self._uploaded_data[:, 1:2], dtype=np.float64) - self._offset[1]
+        z = np.array(self._uploaded_data[:, 2:3], dtype=np.float32 if self._use_float32 else np.float64)
+        z -= self._offset[2]
+        tree = cKDTree(np.hstack((x, y)))
+        self._message_handler.push_message('Data', 'info', 'KD-tree of %d points built in %.2f s'
+                                           % (z.shape[0], time() - start))
+        with self._data_lock:
+            self._x_axis = None
+            self._y_axis = None
+            self._x, self._y, self._z = x, y, z
+            self._tree = tree
+            self._tree_offset = np.zeros(2)
+            self._reset_data()
+
+    def _show_preview(self, x_axis, y_axis, preview_fcn):
+        # Coarse bin-averaged grid displayed while the full resolution grid is interpolated
+        start = time()
+        max_cells = max(min(self._PREVIEW_MAX_CELLS, self._gridder.n_points / self._PREVIEW_POINTS_PER_CELL), 4)
+        num_x, num_y = self._get_grid_size(x_axis[-1] - x_axis[0], y_axis[-1] - y_axis[0],
+                                           (x_axis[-1] - x_axis[0]) / max(len(x_axis) - 1, 1), max_cells)
+        preview_x = np.linspace(x_axis[0], x_axis[-1], num_x)
+        preview_y = np.linspace(y_axis[0], y_axis[-1], num_y)
+        self._set_grid(preview_x, preview_y, self._gridder.grid(preview_x, preview_y, 'bin_average'))
+        self.reset_filters()
+        self._message_handler.push_message('Data', 'info', 'Preview grid (%d x %d) generated in %.2f s, '
+                                                           'interpolating full resolution grid...'
+                                           % (num_x, num_y, time() - start))
+        try:
+            for fcn in preview_fcn:
+                fcn()
+        except:
+            self._message_handler.push_message('Data', 'error', 'Error calling the processor methods')
+
+    def _set_grid(self, x_axis, y_axis, z):
+        # The axes and Z values are given in the coordinates of the loaded points. The new arrays are built first
+        # and swapped together so a reader never mixes the preview and the full resolution grid
+        x_axis = np.array(x_axis, dtype=np.float64) - self._offset[0]
+        y_axis = np.array(y_axis, dtype=np.float64) - self._offset[1]
+        z = np.array(z, dtype=np.float32 if self._use_float32 else np.float64)
+        z -= self._offset[2]
+        with self._data_lock:
+            self._x_axis = x_axis
+            self._y_axis = y_axis
+            self._x = np.broadcast_to(x_axis[np.newaxis, :], (len(y_axis), len(x_axis)))
+            self._y = np.broadcast_to(y_axis[:, np.newaxis], (len(y_axis), len(x_axis)))
+            self._z = z
+            self._tree = None
+            self._reset_data()
+
+    def _reset_data(self):
+        self._data_version += 1
+        self._valid = None
+        # Set the mask selecting all points available
+        self._mask = S4SBitMask.S4SBitMask.ones(self._z.shape)
+        self._mask_version += 1
+        self._color = None
+        self._color_sample = None
+        self._has_mask_changed = True
+        self._step = max(int(np.max([self._x.shape[0], self._x.shape[1]]) / self._MAX_POINTS), 1)
+
+        self.update_mask()
+        if self._use_plane:
+            self.calc_fitting_plane()
+        # Calculate center of mass and remove the offset
+        self.calc_center_of_mass()
+        # Set the number of points to the details dictionary
+        self._details['n_points'] = self._z.size
+
+        self._details['max'] = self._z[np.logical_not(np.isnan(self._z))].max()
+        self._details['min'] = self._z[np.logical_not(np.isnan(self._z))].min()
+
+    def regrid(self):
+        # Generate the grid again from the loaded points, e.g. after changing the pitch or the interpolation method
+        if self._uploaded_data is None or self._gridder.n_points == 0:
+            raise ValueError('No points have been loaded')
+        self._generate_grid()
+        self._message_handler.push_message('Data', 'info', 'Grid updated')
+        return True
+
+    def interpolate_points(self, x, y, method=None):
+        # Interpolate Z at arbitrary XY positions from the loaded points, the positions and the result are in the
+        # coordinates of the displayed data, i.e. after remove_offset
+        if self._gridder.n_points == 0:
+            raise ValueError('No points have been loaded')
+        if method is None:
+            method = self.get_grid_method()
+        if method == 'bin_average':
+            method = 'linear'
+        return self._gridder.evaluate(np.asarray(x, dtype=np.float64) + self._offset[0],
+                                      np.asarray(y, dtype=np.float64) + self._offset[1], method) - self._offset[2]
+
+    def calc_point_spacing(self):
+        if self._uploaded_data is None or len(self._uploaded_data) < 2:
+            raise ValueError('No points have been loaded')
+        points = self._uploaded_data[:, 0:2]
+
+        # Measure the spacing in a centered tile holding about _SPACING_SAMPLES points instead of the whole cloud
+        ratio = min(1.0, np.sqrt(self._SPACING_SAMPLES / float(len(points))))
+        if ratio < 1.0:
+            center = (points.min(axis=0) + points.max(axis=0)) / 2.0
+            half_size = ratio * (points.max(axis=0) - points.min(axis=0)) / 2.0
+            tile = np.all(np.abs(points - center) <= half_size, axis=1)
+            if np.count_nonzero(tile) >= self._SPACING_MIN_SAMPLES:
+                points = points[tile]
+
+        dist = cKDTree(points).query(points, k=2)[0][:, 1]
+        dist = dist[dist > 0]
+        if dist.size == 0:
+            raise ValueError('All points have the same XY coordinates')
+        return float(np.median(dist))
+
+    def _get_grid_size(self, range_x, range_y, pitch, max_cells=None):
+        if max_cells is None:
+            max_cells = self._max_grid_cells
+        num_x = max(int(range_x / pitch) + 1, 2)
+        num_y = max(int(range_y / pitch) + 1, 2)
+        if num_x * num_y > max_cells:
+            # Coarsen the pitch so the grid stays within the cell budget
+            scale = np.sqrt(num_x * num_y / float(max_cells))
+            num_x = max(int(num_x / scale), 2)
+            num_y = max(int(num_y / scale), 2)
+        return num_x, num_y
+
+    def get_grid_method(self):
+        # Resolve the automatic interpolation method for the loaded points
+        if self._interp_method != 'auto':
+            return self._interp_method
+        if self._gridder.n_points > self._BIN_AVERAGE_MIN_POINTS:
+            return 'bin_average'
+        return 'cubic'
+
+    def _load_cached_grid(self, x_axis, y_axis, method):
+        if not self._use_cache or self._source_key is None:
+            return None
+        cached = self._grid_cache.load(S4SGridCache.S4SGridCache.get_key(self._source_key, x_axis, y_axis, method))
+        if cached is not None and np.array_equal(cached[0], x_axis) and np.array_equal(cached[1], y_axis):
+            self._message_handler.push_message('Data', 'info', 'Grid loaded from cache')
+            return cached[2]
+        return None
+
+    def _interpolate_grid(self, x_axis, y_axis, method, is_running=None):
+        # Returns None if the interpolation was stopped
+        key = None
+        if self._use_cache and self._source_key is not None:
+            key = S4SGridCache.S4SGridCache.get_key(self._source_key, x_axis, y_axis, method)
+
+        start = time()
+        if self._n_processes > 1 and method in ['cubic', 'linear'] and \
+                self._gridder.n_points >= self._TILED_GRID_MIN_POINTS:
+            self._message_handler.push_message('Data', 'info', 'Interpolating grid tiles with %d processes...'
+                                               % self._n_processes)
+            z = self._gridder.grid_tiled(x_axis, y_axis, method, self._n_processes, is_running)
+        else:
+            z = self._gridder.grid(x_axis, y_axis, method, is_running)
+        if z is None:
+            return None
+        self._message_handler.push_message('Data', 'info', 'Grid interpolated in %.2f s, method=%s'
+                                           % (time() - start, method))
+
+        if key is not None:
+            try:
+                self._grid_cache.store(key, x_axis, y_axis, z)
+            except (IOError, OSError), e:
+                self._message_handler.push_message('Data', 'warning', 'Cannot write the grid cache, error=' + str(e))
+        return z
+
+    def _read_points(self, parser, data_file):
+        file_size = os.path.getsize(data_file)
+        is_compressed = S4SCompressedFile.S4SCompressedFile.is_compressed(data_file)
+        if self._n_processes > 1 and file_size >= self._PARALLEL_MIN_SIZE and not is_compressed:
+            return self._read_points_parallel(parser, data_file)
+
+        buffer = S4SPointBuffer.S4SPointBuffer(dtype=parser.dtype)
+        n_bytes = 0
+        start = time()
+        last_message = start
+
+        if is_compressed:
+            # Compressed files are decoded while streaming, progress refers to the compressed bytes
+            file_obj = S4SCompressedFile.S4SCompressedFile(data_file)
+            get_position = lambda: file_obj.compressed_position
+            self._message_handler.push_message('Data', 'info', 'Decompressing ' + file_obj.compression + ' file...')
+        else:
+            file_obj = open(data_file, 'rb')
+            get_position = None
+
+        try:
+            for rows, block_size in parser.iter_file(file_obj):
+                # Cancellation is checked once per chunk
+                if not self._thread_is_running:
+                    return None
+
+                n_bytes = n_bytes + block_size if get_position is None else get_position()
+                if buffer.capacity == 0:
+                    buffer.reserve(parser.estimate_capacity(file_size, n_bytes, rows.shape[0]))
+                buffer.append(rows)
+
+                stamp = time()
+                if stamp - last_message > self._PROGRESS_PERIOD:
+                    last_message = stamp
+                    self._message_handler.push_message('Data', 'info', self._progress_message(n_bytes, file_size,
+                                                                                              buffer.n_rows,
+                                                                                              stamp - start))
+        finally:
+            file_obj.close()
+
+        self._message_handler.push_message('Data', 'info', self._progress_message(n_bytes, file_size, buffer.n_rows,
+                                                                                  time() - start))
+        return buffer.data
+
+    def _read_points_parallel(self, parser, data_file):
+        file_size = os.path.getsize(data_file)
+        start = time()
+        progress = {'last_message': start, 'n_bytes': 0, 'n_points': 0}
+
+        def push_progress(n_bytes, n_points):
+            progress['n_bytes'] = n_bytes
+            progress['n_points'] = n_points
+            stamp = time()
+            if stamp - progress['last_message'] > self._PROGRESS_PERIOD:
+                progress['last_message'] = stamp
+                self._message_handler.push_message('Data', 'info', self._progress_message(n_bytes, file_size,
+                                                                                          n_points, stamp - start))
+
+        self._message_handler.push_message('Data', 'info', 'Parsing file with %d processes...' % self._n_processes)
+        parallel_parser = S4SParallelParser.S4SParallelParser(parser, self._n_processes)
+        points = parallel_parser.parse_file(data_file,
+                                            is_running=lambda: self._thread_is_running,
+                                            progress_fcn=push_progress)
+        if points is not None:
+            self._message_handler.push_message('Data', 'info', self._progress_message(progress['n_bytes'], file_size,
+                                                                                      points.shape[0], time() - start))
+        return points
+
+    def _progress_message(self, n_bytes, file_size, n_points, elapsed):
+        elapsed = max(elapsed, 1e-6)
+        return 'Reading measurement data... %d%% [%.1f MB/s, %d points/s, number of points read = %d]' % \
+               (100 * n_bytes / max(file_size, 1), n_bytes / elapsed / 1e6, n_points / elapsed, n_points)
+
+    def open_file(self, comments='#', separator=' ', skip_row=0, callback_fcn=[], preview_fcn=[]):
         self._thread_is_running = True
 
         self._message_handler.push_message('Data', 'info', 'Opening file, file=' + self._details['filename'])
@@ -595,56 +1564,29 @@ class S4SData(object):
         data_file = os.path.join(self._details['dir'], self._details['filename'])
 
         try:
-            file_obj = open(data_file, 'r')
             self._uploaded_data = None
-            i = 0
             self._message_handler.push_message('Data', 'info', 'Reading measurement data...')
-            start = time()
-            message_sent = 0
-            message_stamps = {5: lambda x: 'Still loading file, hang on... [Number of lines read = ' + str(x) + ']',
-                              10: lambda x: 'Big file, this will take a while... [Number of  lines read = ' + str(x)
-                                            + ']',
-                              30: lambda x: 'Get a coffee, still not done loading... [Number of lines read = '
-                                                       + str(x) + ']',
-                              60: lambda x: 'Get a coffee, still not done loading... [Number of lines read = '
-                                                       + str(x) + ']',
-                              120: lambda x: 'Get a coffee, still not done loading... [Number of lines read = '
-                                                       + str(i) + ']'}
-
-            lines = file_obj.readlines()
-            for line in lines:
-                if not self._thread_is_running:
-                    self._message_handler.push_message('Data', 'info', 'Stop loading file...')
-                    return False
-
-                stamp = time()
-                if i < skip_row:
-                    continue
-                if line.find(comments) != -1:
-                    continue
-                i += 1
-                for n in range(len(message_stamps.keys())):
-                    key = message_stamps.keys()[n]
-                    if stamp - start > key:
-                        if n == 0 and message_sent == 0:
-                            message_sent = key
-                            message_stamps[key](i)
-                        elif message_sent == message_stamps.keys()[n - 1]:
-                            message_sent = key
-                            message_stamps[key](i)
-
-                if any(c.isalpha() for c in line) or not any(c.isdigit() for c in line):
-                    continue
-
-                elems = re.findall('[-+]?\d+.\d+', line)
-                if len(elems) == 3:
-                    num_line = [float(x) for x in elems]
-                    if self._uploaded_data is None:
-                        self._uploaded_data = np.array(num_line)
-                    else:
-                        self._uploaded_data = np.vstack((self._uploaded_data, num_line))
+            if S4SReader.S4SReader.is_supported(data_file):
+                # Binary files are memory mapped and need no point cache
+                points = S4SReader.S4SReader.read_file(data_file)
+                self._source_key = {'file': os.path.basename(data_file),
+                                    'path': os.path.dirname(os.path.abspath(data_file)),
+                                    'size': str(os.path.getsize(data_file)),
+                                    'mtime': repr(os.path.getmtime(data_file)),
+                                    'dtype': points.dtype.name}
+            else:
+                parser = S4SParser.S4SParser(comments=comments, separator=separator, skip_row=skip_row)
+                self._source_key = S4SPointCache.S4SPointCache.get_key(data_file, parser)
+                points = self._load_cached_points(parser, data_file)
+                if points is None:
+                    points = self._read_points(parser, data_file)
+                    if points is None:
+                        self._message_handler.push_message('Data', 'info', 'Stop loading file...')
+                        return False
+                    self._store_cached_points(parser, data_file, points)
+            if points.shape[0] > 0:
+                self._uploaded_data = points
             self._message_handler.push_message('Data', 'info', 'All values stored...Generating matrices...')
-            file_obj.close()
         except Exception, e:
             self._message_handler.push_message('Data', 'error',
                                                'Error loading file, error=' + str(e) + ', file=' +
@@ -660,66 +1602,47 @@ class S4SData(object):
             return False
 
         if self._uploaded_data is None:
+            self._message_handler.push_message('Data', 'error', 'No valid XYZ points found, file=' +
+                                               self._details['filename'])
+            if len(callback_fcn) > 0:
+                try:
+                    for fcn in callback_fcn:
+                        fcn()
+                except:
+                    self._message_handler.push_message('Data', 'error', 'Error calling the processor methods')
+            self._thread_is_running = False
             return False
 
-        # Load file as numpy matrix and set the mask selecting all points available
-        min_x = self._uploaded_data[:, 0].min()
-        max_x = self._uploaded_data[:, 0].max()
-        min_y = self._uploaded_data[:, 1].min()
-        max_y = self._uploaded_data[:, 1].max()
-        min_z = self._uploaded_data[:, 2].min()
-        max_z = self._uploaded_data[:, 2].max()
-
-        self._details['range_x'] = max_x - min_x
-        self._details['range_y'] = max_y - min_y
-        self._details['range_z'] = max_z - min_z
-
-        num_x = int((max_x - min_x) / 0.01)
-        num_y = int((max_y - min_y) / 0.01)
-
-        print 'range_x=%d, range_y=%d' % (max_x - min_x, max_y - min_y)
-        print 'num_x=%d, num_y=%d' % (num_x, num_y)
-        print 'x=', min_x, max_x
-        print 'y=', min_y, max_y
-        print ' '
+        self._gridder.set_points(self._uploaded_data)
+        self._offset = np.zeros(3)
 
         self._label = ''
         self._comment = ''
         if not self.read_from_ini_file():
             self.store_ini_file()
 
-        self._x, self._y = np.meshgrid(np.linspace(min_x, max_x, max(num_x, 1000)),
-                                       np.linspace(min_y, max_y, max(num_y, 1000)))
-
-        self._z = griddata((self._uploaded_data[:, 0], self._uploaded_data[:, 1]),
-                           self._uploaded_data[:, 2],
-                           (self._x, self._y),
-                           method='cubic')
-
-        self._mask = np.ones(shape=self._z.shape, dtype=bool)
-        self._color = None
-        self._has_mask_changed = True
-        self._step = np.fix(np.max([self._x.shape[0], self._x.shape[1]]) / self._MAX_POINTS)
-        if self._step < 1:
-            self._step = 1
-
-        self.update_mask()
-        if self._use_plane:
-            self.calc_fitting_plane()
-        # Calculate center of mass and remove the offset
-        self.calc_center_of_mass()
-        # Set the number of points to the details dictionary
-        self._details['n_points'] = self._x.size
-
         last_modified = os.path.getmtime(data_file)
         self._details['last_modified'] = datetime.datetime.fromtimestamp(last_modified)
         size = int(round(os.path.getsize(data_file) * 0.001))
         self._details['file_size'] = str(size) + ' kB' if size < 1000  else str(float(size / 1000.0)) + ' MB'
 
-        self._details['max'] = self._z[np.logical_not(np.isnan(self._z))].max()
-        self._details['min'] = self._z[np.logical_not(np.isnan(self._z))].min()
-
-        self.reset_filters()
+        try:
+            if not self._generate_grid(preview_fcn, lambda: self._thread_is_running):
+                self._message_handler.push_message('Data', 'info', 'Stop loading file...')
+                return False
+            self.reset_filters()
+        except Exception, e:
+            self._message_handler.push_message('Data', 'error',
+                                               'Error generating matrices, error=' + str(e) + ', file=' +
+                                               self._details['filename'])
+            if len(callback_fcn) > 0:
+                try:
+                    for fcn in callback_fcn:
+                        fcn()
+                except:
+                    self._message_handler.push_message('Data', 'error', 'Error calling the processor methods')
+            self._thread_is_running = False
+            return False
 
         if len(callback_fcn) > 0:
             try:
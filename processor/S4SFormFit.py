@@ -0,0 +1,139 @@
+__author__ = 'Musa Morena Marcusso Manhaes'
+
+import numpy as np
+from numpy.polynomial import legendre
+
+
+class S4SFormFit(object):
+    # Least-squares 2-D polynomial surface z = sum(c_ij * P_i(u) * P_j(v)) for i + j <= order, where P_i are the
+    # Legendre polynomials and u, v the X and Y coordinates scaled to [-1, 1] over the given ranges. The normal
+    # equations are accumulated from blocks of points, the design matrix of all points is never built
+    _ORDERS = [1, 2, 3, 4, 5, 6]
+    # Maximum number of grid cells or design matrix elements held in memory at once
+    _BLOCK_CELLS = 1024 * 1024
+
+    def __init__(self, order, x_range, y_range):
+        if order not in self._ORDERS:
+            raise ValueError('Invalid polynomial order, order=' + str(order))
+        if len(x_range) != 2 or len(y_range) != 2:
+            raise ValueError('The ranges must have two elements, [min, max]')
+        self._order = int(order)
+        # Scale and offset mapping the coordinates to [-1, 1]
+        self._center = np.array([(x_range[0] + x_range[1]) / 2.0, (y_range[0] + y_range[1]) / 2.0])
+        self._scale = np.array([max((x_range[1] - x_range[0]) / 2.0, 1e-12),
+                                max((y_range[1] - y_range[0]) / 2.0, 1e-12)])
+        # Degrees in X and Y of each term of the polynomial
+        self._terms = [(i, j) for i in range(self._order + 1) for j in range(self._order + 1 - i)]
+        self._term_x = np.array([t[0] for t in self._terms], dtype=np.intp)
+        self._term_y = np.array([t[1] for t in self._terms], dtype=np.intp)
+        self._coefficients = None
+        self.clear()
+
+    @classmethod
+    def get_orders(cls):
+        return cls._ORDERS
+
+    @property
+    def order(self):
+        return self._order
+
+    @property
+    def terms(self):
+        return self._terms
+
+    @property
+    def n_terms(self):
+        return len(self._terms)
+
+    @property
+    def n_points(self):
+        return int(round(self._n))
+
+    @property
+    def coefficients(self):
+        return self._coefficients
+
+    def get_param_key(self):
+        # Hashable description of the fitted surface
+        coefficients = () if self._coefficients is None else tuple(self._coefficients)
+        return (self._order, tuple(self._center), tuple(self._scale)) + coefficients
+
+    def clear(self):
+        self._ata = np.zeros((self.n_terms, self.n_terms))
+        self._atz = np.zeros(self.n_terms)
+        self._n = 0.0
+
+    def _get_vander(self, values, axis):
+        values = (np.asarray(values, dtype=np.float64) - self._center[axis]) / self._scale[axis]
+        return legendre.legvander(values, self._order)
+
+    def add_points(self, x, y, z, weight=1.0):
+        # Add (weight = 1) or remove (weight = -1) a set of points, the design matrix is built by blocks of points
+        x = np.asarray(x).ravel()
+        y = np.asarray(y).ravel()
+        z = np.asarray(z).ravel()
+        if x.shape != y.shape or x.shape != z.shape:
+            raise ValueError('The X, Y and Z vectors must have the same size')
+        n_block = max(self._BLOCK_CELLS // self.n_terms, 1)
+        for i0 in range(0, z.size, n_block):
+            a = self._get_vander(x[i0:i0 + n_block], 0)[:, self._term_x] * \
+                self._get_vander(y[i0:i0 + n_block], 1)[:, self._term_y]
+            self._ata += weight * np.dot(a.T, a)
+            self._atz += weight * np.dot(a.T, z[i0:i0 + n_block].astype(np.float64))
+        self._n += weight * z.size
+
+    def add_grid(self, x_axis, y_axis, z, mask, weight=1.0):
+        # Add the selected cells of a regular grid given by its 1-D axes. The terms are products of one polynomial
+        # in X and one in Y, so the normal equations of a block of rows follow from the products of the masked
+        # block with the 1-D Vandermonde matrices of the axes
+        if z.shape != (len(y_axis), len(x_axis)) or mask.shape != z.shape:
+            raise ValueError('The Z matrix and the mask must have the shape of the grid axes')
+        n = self._order + 1
+        vx = self._get_vander(x_axis, 0)
+        vy = self._get_vander(y_axis, 1)
+        # Products P_i(u) * P_k(u) of all pairs of polynomials in X and in Y
+        vx2 = (vx[:, :, np.newaxis] * vx[:, np.newaxis, :]).reshape(len(x_axis), n * n)
+        vy2 = (vy[:, :, np.newaxis] * vy[:, np.newaxis, :]).reshape(len(y_axis), n * n)
+        # Normal matrix for all pairs of terms (jx, jy) x (kx, ky), indexed as [jy, ky, jx, kx]
+        ata = np.zeros((n * n, n * n))
+        atz = np.zeros((n, n))
+        n_rows = max(self._BLOCK_CELLS // max(len(x_axis), 1), 1)
+        for i0 in range(0, z.shape[0], n_rows):
+            i1 = min(i0 + n_rows, z.shape[0])
+            m = np.asarray(mask[i0:i1], dtype=np.float64)
+            ata += np.dot(vy2[i0:i1].T, np.dot(m, vx2))
+            mz = np.where(mask[i0:i1], z[i0:i1], 0.0)
+            atz += np.dot(vy[i0:i1].T, np.dot(mz, vx))
+            self._n += weight * m.sum()
+        ata = ata.reshape(n, n, n, n)
+        self._ata += weight * ata[self._term_y[:, np.newaxis], self._term_y[np.newaxis, :],
+                                  self._term_x[:, np.newaxis], self._term_x[np.newaxis, :]]
+        self._atz += weight * atz[self._term_y, self._term_x]
+
+    def solve(self):
+        if self._n < self.n_terms:
+            raise ValueError('At least %d points are needed to fit a polynomial of order %d'
+                             % (self.n_terms, self._order))
+        # Least-squares solution also handles rank deficient selections, e.g. a single row of the grid
+        self._coefficients = np.linalg.lstsq(self._ata, self._atz, rcond=None)[0]
+        return self._coefficients
+
+    def _get_coefficient_matrix(self):
+        # Coefficients as a matrix indexed by the degree in Y and X
+        if self._coefficients is None:
+            raise ValueError('The polynomial has not been fitted')
+        c = np.zeros((self._order + 1, self._order + 1))
+        c[self._term_y, self._term_x] = self._coefficients
+        return c
+
+    def eval_points(self, x, y):
+        x = np.asarray(x)
+        c = self._get_coefficient_matrix()
+        vx = self._get_vander(x.ravel(), 0)
+        vy = self._get_vander(np.asarray(y).ravel(), 1)
+        return (np.dot(vy, c) * vx).sum(axis=1).reshape(x.shape)
+
+    def eval_grid(self, x_axis, y_axis):
+        # The surface of a grid is the product of the 1-D Vandermonde matrices with the coefficient matrix
+        return np.dot(np.dot(self._get_vander(y_axis, 1), self._get_coefficient_matrix()),
+                      self._get_vander(x_axis, 0).T)
@@ -0,0 +1,109 @@
+__author__ = 'Musa Morena Marcusso Manhaes'
+
+import os
+import hashlib
+import numpy as np
+
+
+class S4SGridCache(object):
+    _DEFAULT_DIR = './cache'
+    # Default disk budget for all cached grids [bytes]
+    _DEFAULT_MAX_SIZE = 2 * 1024 ** 3
+    _EXT = '.npz'
+
+    def __init__(self, cache_dir=None, max_size=None):
+        self._cache_dir = self._DEFAULT_DIR if cache_dir is None else cache_dir
+        self._max_size = self._DEFAULT_MAX_SIZE if max_size is None else int(max_size)
+        if self._max_size < 0:
+            raise ValueError('The maximum cache size cannot be negative')
+
+    @property
+    def cache_dir(self):
+        return self._cache_dir
+
+    @cache_dir.setter
+    def cache_dir(self, new_dir):
+        if type(new_dir) is not str:
+            raise TypeError('Cache directory must be a string')
+        self._cache_dir = new_dir
+
+    @property
+    def max_size(self):
+        return self._max_size
+
+    @max_size.setter
+    def max_size(self, new_size):
+        if new_size < 0:
+            raise ValueError('The maximum cache size cannot be negative')
+        self._max_size = int(new_size)
+        self.evict()
+
+    @property
+    def size(self):
+        return sum([os.path.getsize(f) for f in self._get_files()])
+
+    @classmethod
+    def get_key(cls, source_key, x_axis, y_axis, method):
+        # The grid is identified by its source points, the axes limits and sampling and the interpolation method
+        items = sorted(source_key.items())
+        items.append(('x_axis', repr((float(x_axis[0]), float(x_axis[-1]), len(x_axis)))))
+        items.append(('y_axis', repr((float(y_axis[0]), float(y_axis[-1]), len(y_axis)))))
+        items.append(('method', str(method)))
+        return hashlib.sha1(repr(items)).hexdigest()
+
+    def load(self, key):
+        filename = self._get_filename(key)
+        if not os.path.isfile(filename):
+            return None
+        try:
+            cached = np.load(filename)
+            x, y, z = cached['x'], cached['y'], cached['z']
+            cached.close()
+        except (IOError, ValueError, KeyError):
+            return None
+        if z.shape != (y.size, x.size):
+            return None
+        # Refresh the timestamp so the least recently used entries are evicted first
+        os.utime(filename, None)
+        return x, y, z
+
+    def store(self, key, x, y, z):
+        if self._max_size == 0:
+            return False
+        if not os.path.isdir(self._cache_dir):
+            os.makedirs(self._cache_dir)
+
+        filename = self._get_filename(key)
+        temp_file = filename + '.tmp'
+        fid = open(temp_file, 'wb')
+        try:
+            np.savez(fid, x=x, y=y, z=z)
+        finally:
+            fid.close()
+        if os.path.isfile(filename):
+            os.remove(filename)
+        os.rename(temp_file, filename)
+
+        self.evict()
+        return os.path.isfile(filename)
+
+    def evict(self):
+        files = sorted(self._get_files(), key=os.path.getmtime)
+        total = sum([os.path.getsize(f) for f in files])
+        for f in files:
+            if total <= self._max_size:
+                break
+            total -= os.path.getsize(f)
+            os.remove(f)
+
+    def clear(self):
+        for f in self._get_files():
+            os.remove(f)
+
+    def _get_filename(self, key):
+        return os.path.join(self._cache_dir, key + self._EXT)
+
+    def _get_files(self):
+        if not os.path.isdir(self._cache_dir):
+            return []
+        return [os.path.join(self._cache_dir, f) for f in os.listdir(self._cache_dir) if f.endswith(self._EXT)]
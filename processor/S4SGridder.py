@@ -0,0 +1,245 @@
+__author__ = 'Musa Morena Marcusso Manhaes'
+
+import multiprocessing
+import numpy as np
+from scipy.interpolate import griddata, LinearNDInterpolator, CloughTocher2DInterpolator, NearestNDInterpolator
+from scipy.spatial import Delaunay
+from scipy.ndimage import distance_transform_edt
+
+# Points shared with the tiling worker processes, set by the pool initializer
+_TILE_POINTS = None
+
+
+def _init_tile_worker(points):
+    global _TILE_POINTS
+    _TILE_POINTS = points
+
+
+def _grid_tile(args):
+    x_axis, y_axis, bounds, method = args
+    x_min, x_max, y_min, y_max = bounds
+    selected = np.logical_and(np.logical_and(_TILE_POINTS[:, 0] >= x_min, _TILE_POINTS[:, 0] <= x_max),
+                              np.logical_and(_TILE_POINTS[:, 1] >= y_min, _TILE_POINTS[:, 1] <= y_max))
+    points = _TILE_POINTS[selected]
+    if points.shape[0] < 3:
+        z = np.empty((len(y_axis), len(x_axis)))
+        z.fill(np.nan)
+        return z
+    x, y = np.meshgrid(x_axis, y_axis)
+    try:
+        return griddata((points[:, 0], points[:, 1]), points[:, 2], (x, y), method=method)
+    except Exception:
+        # Degenerate tiles (e.g. collinear points) cannot be triangulated
+        z = np.empty(x.shape)
+        z.fill(np.nan)
+        return z
+
+
+def _grid_indexed_tile(args):
+    # Tiles are returned in completion order together with their index
+    index, tile_args = args
+    return index, _grid_tile(tile_args)
+
+
+class S4SGridder(object):
+    _METHODS = ['cubic', 'linear', 'nearest', 'bin_average']
+    # Interpolation methods that are computed by tiles when more than one process is used
+    _TILED_METHODS = ['cubic', 'linear']
+    # Number of tiles per process
+    _TILES_PER_PROCESS = 2
+    # Overlap added around each tile so the triangulation at the tile interior matches the single pass [grid cells]
+    _TILE_MARGIN = 16
+    # Empty bins up to this distance from a filled bin take the value of the nearest filled bin, larger holes and
+    # the area outside the part stay NaN [grid cells]
+    _BIN_FILL_CELLS = 1.5
+    # Number of grid cells interpolated at once when the interpolation can be stopped
+    _EVAL_BLOCK_CELLS = 256 * 1024
+    # Interval between two checks of the stop request while waiting for the tiles [s]
+    _STOP_POLL_PERIOD = 0.1
+
+    def __init__(self, points=None):
+        self._points = None
+        # Triangulation and interpolators built once per point set
+        self._triangulation = None
+        self._interpolators = {}
+        if points is not None:
+            self.set_points(points)
+
+    @classmethod
+    def get_methods(cls):
+        return cls._METHODS
+
+    @property
+    def points(self):
+        return self._points
+
+    @property
+    def n_points(self):
+        return 0 if self._points is None else self._points.shape[0]
+
+    def set_points(self, points):
+        if not isinstance(points, np.ndarray):
+            raise TypeError('The points must be a numpy array')
+        if points.ndim != 2 or points.shape[1] != 3:
+            raise ValueError('The points must be a (N, 3) array')
+        if points is self._points:
+            return
+        self._points = points
+        self.clear_cache()
+
+    @property
+    def has_triangulation(self):
+        return self._triangulation is not None
+
+    def clear_cache(self):
+        self._triangulation = None
+        self._interpolators = {}
+
+    def get_triangulation(self):
+        if self._points is None:
+            raise ValueError('No points have been set')
+        if self._triangulation is None:
+            self._triangulation = Delaunay(np.asarray(self._points[:, 0:2], dtype=np.float64))
+        return self._triangulation
+
+    def get_interpolator(self, method='cubic'):
+        if self._points is None:
+            raise ValueError('No points have been set')
+        if method not in self._interpolators:
+            values = np.asarray(self._points[:, 2], dtype=np.float64)
+            if method == 'cubic':
+                self._interpolators[method] = CloughTocher2DInterpolator(self.get_triangulation(), values)
+            elif method == 'linear':
+                self._interpolators[method] = LinearNDInterpolator(self.get_triangulation(), values)
+            elif method == 'nearest':
+                self._interpolators[method] = NearestNDInterpolator(self._points[:, 0:2], values)
+            else:
+                raise ValueError('No interpolator object available for the method ' + str(method))
+        return self._interpolators[method]
+
+    def evaluate(self, x, y, method='cubic'):
+        # Interpolate Z at arbitrary query points reusing the cached interpolator
+        x = np.asarray(x, dtype=np.float64)
+        y = np.asarray(y, dtype=np.float64)
+        if x.shape != y.shape:
+            raise ValueError('The X and Y query points must have the same shape')
+        return self.get_interpolator(method)(x, y)
+
+    def grid(self, x_axis, y_axis, method='cubic', is_running=None):
+        # Returns the Z values on the regular grid defined by the 1-D axes as a (len(y_axis), len(x_axis)) array.
+        # With is_running the grid is interpolated by blocks of rows and None is returned once it returns False,
+        # building the interpolator itself cannot be interrupted
+        if self._points is None:
+            raise ValueError('No points have been set')
+        if method not in self._METHODS:
+            raise ValueError('Invalid interpolation method, method=' + str(method))
+
+        if method == 'bin_average':
+            return self._grid_bin_average(x_axis, y_axis)
+        if is_running is None:
+            x, y = np.meshgrid(x_axis, y_axis)
+            return self.evaluate(x, y, method)
+
+        interpolator = self.get_interpolator(method)
+        z = np.empty((len(y_axis), len(x_axis)))
+        n_rows = max(self._EVAL_BLOCK_CELLS // max(len(x_axis), 1), 1)
+        for i0 in range(0, len(y_axis), n_rows):
+            if not is_running():
+                return None
+            x, y = np.meshgrid(x_axis, y_axis[i0:i0 + n_rows])
+            z[i0:i0 + n_rows] = interpolator(x, y)
+        return z
+
+    def grid_tiled(self, x_axis, y_axis, method='cubic', n_processes=None, is_running=None):
+        # Interpolate tiles of the grid in a process pool and stitch their interiors into the final grid. is_running
+        # is checked after each tile, if it returns False the pool is terminated and None is returned
+        if self._points is None:
+            raise ValueError('No points have been set')
+        if method not in self._TILED_METHODS:
+            raise ValueError('Tiled gridding is only available for the methods ' + ', '.join(self._TILED_METHODS))
+        if n_processes is None:
+            n_processes = multiprocessing.cpu_count()
+
+        tiles = self.get_tiles(len(x_axis), len(y_axis), n_processes * self._TILES_PER_PROCESS)
+        pitch_x = (x_axis[-1] - x_axis[0]) / max(len(x_axis) - 1, 1)
+        pitch_y = (y_axis[-1] - y_axis[0]) / max(len(y_axis) - 1, 1)
+
+        tasks = []
+        for i0, i1, j0, j1 in tiles:
+            bounds = (x_axis[j0] - self._TILE_MARGIN * pitch_x, x_axis[j1 - 1] + self._TILE_MARGIN * pitch_x,
+                      y_axis[i0] - self._TILE_MARGIN * pitch_y, y_axis[i1 - 1] + self._TILE_MARGIN * pitch_y)
+            tasks.append((x_axis[j0:j1], y_axis[i0:i1], bounds, method))
+
+        z = np.empty((len(y_axis), len(x_axis)))
+        pool = multiprocessing.Pool(n_processes, initializer=_init_tile_worker, initargs=(self._points,))
+        try:
+            # The tiles are taken as they are completed, a stop request terminates the workers without waiting for
+            # the running tiles
+            results = pool.imap_unordered(_grid_indexed_tile, list(enumerate(tasks)))
+            n_done = 0
+            while n_done < len(tasks):
+                if is_running is not None and not is_running():
+                    pool.terminate()
+                    return None
+                try:
+                    k, z_tile = results.next(self._STOP_POLL_PERIOD)
+                except multiprocessing.TimeoutError:
+                    continue
+                i0, i1, j0, j1 = tiles[k]
+                z[i0:i1, j0:j1] = z_tile
+                n_done += 1
+            pool.close()
+        except:
+            pool.terminate()
+            raise
+        finally:
+            pool.join()
+        return z
+
+    @staticmethod
+    def get_tiles(n_x, n_y, n_tiles):
+        # Split the grid indexes into about n_tiles tiles with similar shape, returns (i0, i1, j0, j1) per tile
+        n_tiles_x = max(1, min(n_x, int(round(np.sqrt(n_tiles * n_x / float(n_y))))))
+        n_tiles_y = max(1, min(n_y, int(np.ceil(n_tiles / float(n_tiles_x)))))
+        rows = np.linspace(0, n_y, n_tiles_y + 1).astype(int)
+        cols = np.linspace(0, n_x, n_tiles_x + 1).astype(int)
+        return [(rows[i], rows[i + 1], cols[j], cols[j + 1])
+                for i in range(n_tiles_y) for j in range(n_tiles_x)
+                if rows[i + 1] > rows[i] and cols[j + 1] > cols[j]]
+
+    def _grid_bin_average(self, x_axis, y_axis):
+        # Average of all points closer to each grid node than to its neighbours, isolated empty cells are filled by
+        # the nearest filled cell, the remaining empty cells are NaN
+        n_x = len(x_axis)
+        n_y = len(y_axis)
+        index_x = self._get_bin_index(self._points[:, 0], x_axis)
+        index_y = self._get_bin_index(self._points[:, 1], y_axis)
+        valid = np.logical_and(index_x >= 0, index_y >= 0)
+        cells = index_y[valid] * n_x + index_x[valid]
+
+        sums = np.bincount(cells, weights=self._points[valid, 2], minlength=n_x * n_y)
+        counts = np.bincount(cells, minlength=n_x * n_y)
+
+        z = np.empty(n_x * n_y)
+        z.fill(np.nan)
+        filled = counts > 0
+        z[filled] = sums[filled] / counts[filled]
+        z = z.reshape(n_y, n_x)
+
+        filled = filled.reshape(n_y, n_x)
+        if np.any(filled) and not np.all(filled):
+            distance, index = distance_transform_edt(np.logical_not(filled), return_indices=True)
+            fill = np.logical_and(np.logical_not(filled), distance <= self._BIN_FILL_CELLS)
+            z[fill] = z[index[0][fill], index[1][fill]]
+        return z
+
+    @staticmethod
+    def _get_bin_index(values, axis):
+        n = len(axis)
+        if n == 1:
+            return np.zeros(values.shape, dtype=np.intp)
+        pitch = (axis[-1] - axis[0]) / float(n - 1)
+        index = np.floor((values - axis[0]) / pitch + 0.5).astype(np.intp)
+        # Points outside the half-pitch border around the axis are ignored
+        index[np.logical_or(index < 0, index >= n)] = -1
+        return index
@@ -4,7 +4,7 @@ import numpy as np
 
 
 class S4SMask(object):
-    _MASK_LABELS = ['Circle', 'Rectangle', 'Range']
+    _MASK_LABELS = ['Circle', 'Rectangle', 'Range', 'Polygon']
 
     _CIRCLE_PARAM_LABELS = {'radius': ('Radius', 0.1),
                             'center': ('Center', [0, 0, 0]),
@@ -20,6 +20,9 @@ class S4SMask(object):
                            'upper': ('Upper', 0.0),
                            'is_exc': ('Is excluding?', False)}
 
+    _POLYGON_PARAM_LABELS = {'vertices': ('Vertices', []),
+                             'is_exc': ('Is excluding?', False)}
+
     def __init__(self, id_number=-1, is_exc=False):
         if id_number == -1:
             raise ValueError('Set a positive id number for the mask')
@@ -36,6 +39,11 @@ class S4SMask(object):
 
         self._label = None
 
+        # Result of the last evaluation and the parameters and data version it was computed for
+        self._result = None
+
+        self._result_key = None
+
         self._circle_param = {'radius': 0,
                               'center': np.array([0.0, 0.0, 0.0]),
                               'plane': 'xy',
@@ -66,6 +74,13 @@ class S4SMask(object):
                                         'upper': lambda x: x is not None and x > self._range_param['lower'],
                                         'is_exc': lambda x: type(x) == bool}
 
+        self._polygon_param = {'vertices': np.zeros((0, 2)),
+                               'is_exc': is_exc}
+
+        self._polygon_param_valid_test = {'vertices': lambda x: np.ndim(x) == 2 and np.shape(x)[0] >= 3 and
+                                                                np.shape(x)[1] == 2,
+                                          'is_exc': lambda x: type(x) == bool}
+
     @classmethod
     def get_mask_labels(cls):
         return cls._MASK_LABELS
@@ -82,6 +97,10 @@ class S4SMask(object):
     def get_range_mask_param_labels(cls):
         return cls._RANGE_PARAM_LABELS
 
+    @classmethod
+    def get_polygon_mask_param_labels(cls):
+        return cls._POLYGON_PARAM_LABELS
+
     @property
     def label(self):
         return self._label
@@ -94,6 +113,8 @@ class S4SMask(object):
             return self._range_param['is_exc']
         elif self.is_rect_type:
             return self._rect_param['is_exc']
+        elif self.is_polygon_type:
+            return self._polygon_param['is_exc']
         else:
             return False
 
@@ -106,6 +127,8 @@ class S4SMask(object):
             self._range_param['is_exc'] = flag
         elif self.is_rect_type:
             self._rect_param['is_exc'] = flag
+        elif self.is_polygon_type:
+            self._polygon_param['is_exc'] = flag
 
     @property
     def is_active(self):
@@ -129,6 +152,10 @@ class S4SMask(object):
     def is_range_type(self):
         return self._mask_types['Range']
 
+    @property
+    def is_polygon_type(self):
+        return self._mask_types['Polygon']
+
     def get_mask_type(self):
         for key in self._mask_types:
             if self._mask_types[key]:
@@ -149,6 +176,9 @@ class S4SMask(object):
     def set_range_type(self):
         self._set_mask_type('Range')
 
+    def set_polygon_type(self):
+        self._set_mask_type('Polygon')
+
     def get_param_values(self):
         param = {}
         if self.is_circle_type:
@@ -160,6 +190,9 @@ class S4SMask(object):
         elif self.is_rect_type:
             for key in self._rect_param:
                 param[self._RECT_PARAM_LABELS[key][0]] = self._rect_param[key]
+        elif self.is_polygon_type:
+            for key in self._polygon_param:
+                param[self._POLYGON_PARAM_LABELS[key][0]] = self._polygon_param[key]
 
         return param
 
@@ -202,6 +235,17 @@ class S4SMask(object):
         self._range_param['upper'] = upper
         self._range_param['axis'] = axis
 
+    def set_polygon_param(self, vertices):
+        if type(vertices) is not list and type(vertices) is not np.ndarray:
+            raise TypeError('The vertices must be a list of XY points')
+        vertices = np.array(vertices, dtype=np.float64)
+        if vertices.ndim != 2 or vertices.shape[1] != 2:
+            raise ValueError('Each vertex must have two elements (XY-plane)')
+        if vertices.shape[0] < 3:
+            raise ValueError('The polygon must have at least three vertices')
+        self.set_polygon_type()
+        self._polygon_param['vertices'] = vertices
+
     def set_param(self, label, new_value):
         key = ''
         if self.is_circle_type:
@@ -228,10 +272,139 @@ class S4SMask(object):
                 self._range_param[key] = new_value
             else:
                 return False
+        elif self.is_polygon_type:
+            for item in self._POLYGON_PARAM_LABELS:
+                if label == self._POLYGON_PARAM_LABELS[item][0]:
+                    key = item
+            if len(key) and self._polygon_param_valid_test[key](new_value):
+                self._polygon_param[key] = np.array(new_value, dtype=np.float64) if key == 'vertices' else new_value
+            else:
+                return False
         return True
 
+    def get_xy_bounds(self):
+        # Bounding box [min_x, max_x, min_y, max_y] of the region selected in the XY plane,
+        # None if the region is not bounded in X and Y
+        if self.is_circle_type and self._circle_param['plane'] == 'xy':
+            center = self._circle_param['center']
+            radius = self._circle_param['radius']
+            return [center[0] - radius, center[0] + radius, center[1] - radius, center[1] + radius]
+        elif self.is_rect_type:
+            x = [self._rect_param['low_point'][0], self._rect_param['upper_point'][0]]
+            y = [self._rect_param['low_point'][1], self._rect_param['upper_point'][1]]
+            return [min(x), max(x), min(y), max(y)]
+        elif self.is_polygon_type:
+            vertices = self._polygon_param['vertices']
+            return [vertices[:, 0].min(), vertices[:, 0].max(), vertices[:, 1].min(), vertices[:, 1].max()]
+        return None
+
+    def get_param_key(self):
+        # Hashable snapshot of the mask type and its current parameters
+        if self.is_circle_type:
+            param = self._circle_param
+        elif self.is_rect_type:
+            param = self._rect_param
+        elif self.is_range_type:
+            param = self._range_param
+        elif self.is_polygon_type:
+            param = self._polygon_param
+        else:
+            return None
+        key = [self.get_mask_type()]
+        for name in sorted(param.keys()):
+            value = param[name]
+            if isinstance(value, (list, tuple, np.ndarray)):
+                value = tuple(np.ravel(value).tolist())
+            key.append((name, value))
+        return tuple(key)
+
+    def get_cached_result(self, data_version):
+        # Returns the last result if neither the parameters nor the data changed since, otherwise None
+        if self._result is None or self._result_key != (data_version, self.get_param_key()):
+            return None
+        return self._result
+
+    def set_cached_result(self, result, data_version):
+        self._result = result
+        self._result_key = (data_version, self.get_param_key())
+
+    def clear_cache(self):
+        self._result = None
+        self._result_key = None
+
+    def test_grid(self, x_axis, y_axis, z):
+        # Test the points of a regular grid given by its ascending 1-D axes and the (len(y_axis), len(x_axis))
+        # Z matrix. Masks bounded in X or Y only evaluate the window of rows and columns inside their bounding box
+        if self.get_mask_type() is None:
+            raise AttributeError('No mask type option was set')
+        if z.shape != (len(y_axis), len(x_axis)):
+            raise ValueError('The Z matrix must have the shape of the grid axes')
+
+        test = np.zeros(z.shape, dtype=bool)
+        if self.is_circle_type and self._circle_param['plane'] == 'xy':
+            center = self._circle_param['center']
+            radius = self._circle_param['radius']
+            i0, i1 = self._get_window(y_axis, center[1] - radius, center[1] + radius, False)
+            j0, j1 = self._get_window(x_axis, center[0] - radius, center[0] + radius, False)
+            dist = (x_axis[np.newaxis, j0:j1] - center[0])**2 + (y_axis[i0:i1, np.newaxis] - center[1])**2
+            test[i0:i1, j0:j1] = dist < radius**2
+        elif self.is_rect_type:
+            x_min, x_max, y_min, y_max = self.get_xy_bounds()
+            i0, i1 = self._get_window(y_axis, y_min, y_max, False)
+            j0, j1 = self._get_window(x_axis, x_min, x_max, False)
+            test[i0:i1, j0:j1] = True
+        elif self.is_polygon_type:
+            x_min, x_max, y_min, y_max = self.get_xy_bounds()
+            i0, i1 = self._get_window(y_axis, y_min, y_max, True)
+            j0, j1 = self._get_window(x_axis, x_min, x_max, True)
+            test[i0:i1, j0:j1] = self._rasterize_polygon(x_axis[j0:j1], y_axis[i0:i1])
+        elif self.is_range_type and self._range_param['axis'] in ['x', 'y']:
+            if self._range_param['axis'] == 'x':
+                j0, j1 = self._get_window(x_axis, self._range_param['lower'], self._range_param['upper'], True)
+                test[:, j0:j1] = True
+            else:
+                i0, i1 = self._get_window(y_axis, self._range_param['lower'], self._range_param['upper'], True)
+                test[i0:i1, :] = True
+        else:
+            # Masks depending on Z cannot be restricted to a window
+            x = np.broadcast_to(x_axis[np.newaxis, :], z.shape)
+            y = np.broadcast_to(y_axis[:, np.newaxis], z.shape)
+            return self.test_point(x, y, z)
+
+        # The excluding masks select the complement of the region
+        if self.is_excluding:
+            np.logical_not(test, out=test)
+        return test
+
+    def _rasterize_polygon(self, x_axis, y_axis):
+        # Scanline rasterization with the even-odd rule: each edge crossing a row toggles the cells from the
+        # crossing to the end of the row, the XOR accumulation along the row gives the inside cells
+        test = np.zeros((len(y_axis), len(x_axis) + 1), dtype=bool)
+        if test.size == 0:
+            return test[:, :-1]
+        vertices = self._polygon_param['vertices']
+        x0 = vertices[:, 0]
+        y0 = vertices[:, 1]
+        x1 = np.roll(x0, -1)
+        y1 = np.roll(y0, -1)
+
+        # Half-open rule on the edge end points so a vertex on a row is counted once
+        y = y_axis[:, np.newaxis]
+        rows, edges = np.nonzero(np.logical_or(np.logical_and(y0 <= y, y < y1), np.logical_and(y1 <= y, y < y0)))
+        x_cross = x0[edges] + (y_axis[rows] - y0[edges]) * (x1[edges] - x0[edges]) / (y1[edges] - y0[edges])
+        cols = np.searchsorted(x_axis, x_cross, side='left')
+        np.logical_xor.at(test, (rows, cols), True)
+        return np.logical_xor.accumulate(test, axis=1)[:, :-1]
+
+    @staticmethod
+    def _get_window(axis, lower, upper, is_closed):
+        # Index range [start, end) of the ascending axis values inside the interval
+        if is_closed:
+            return np.searchsorted(axis, lower, side='left'), np.searchsorted(axis, upper, side='right')
+        return np.searchsorted(axis, lower, side='right'), np.searchsorted(axis, upper, side='left')
+
     def test_point(self, x, y, z):
-        if not self.is_circle_type and not self.is_rect_type and not self.is_range_type:
+        if self.get_mask_type() is None:
             raise AttributeError('No mask type option was set')
 
         if type(x) != np.ndarray or type(y) != np.ndarray or type(z) != np.ndarray:
@@ -250,27 +423,27 @@ class S4SMask(object):
                 p1 = 0
                 p2 = 1
                 if self.is_excluding:
-                    return np.sqrt((x - center[p1])**2 + (y - center[p2])**2) >= radius
+                    return (x - center[p1])**2 + (y - center[p2])**2 >= radius**2
                 else:
-                    return np.sqrt((x - center[p1])**2 + (y - center[p2])**2) < radius
+                    return (x - center[p1])**2 + (y - center[p2])**2 < radius**2
             elif self._circle_param['plane'] == 'yz':
                 p1 = 1
                 p2 = 2
                 if self.is_excluding:
-                    z[np.isnan(z)] = 0
-                    return np.sqrt((y - center[p1])**2 + (z - center[p2])**2) >= radius
+                    z = np.where(np.isnan(z), 0, z)
+                    return (y - center[p1])**2 + (z - center[p2])**2 >= radius**2
                 else:
-                    z[np.isnan(z)] = radius + 1000
-                    return np.sqrt((y - center[p1])**2 + (z - center[p2])**2) < radius
+                    z = np.where(np.isnan(z), radius + 1000, z)
+                    return (y - center[p1])**2 + (z - center[p2])**2 < radius**2
             elif self._circle_param['plane'] == 'zx':
                 p1 = 0
                 p2 = 2
                 if self.is_excluding:
-                    z[np.isnan(z)] = 0
-                    return np.sqrt((x - center[p1])**2 + (z - center[p2])**2) >= radius
+                    z = np.where(np.isnan(z), 0, z)
+                    return (x - center[p1])**2 + (z - center[p2])**2 >= radius**2
                 else:
-                    z[np.isnan(z)] = radius + 1000
-                    return np.sqrt((x - center[p1])**2 + (z - center[p2])**2) < radius
+                    z = np.where(np.isnan(z), radius + 1000, z)
+                    return (x - center[p1])**2 + (z - center[p2])**2 < radius**2
 
         elif self.is_rect_type:
             if self.is_excluding:
@@ -306,7 +479,7 @@ class S4SMask(object):
                 elif self._range_param['axis'] == 'y':
                     return np.logical_or(y < lower, y > upper)
                 elif self._range_param['axis'] == 'z':
-                    z[np.isnan(z)] = (upper - lower) / 2.0
+                    z = np.where(np.isnan(z), (upper - lower) / 2.0, z)
                     return np.logical_or(z < lower, z > upper)
             else:
                 if self._range_param['axis'] == 'x':
@@ -314,7 +487,28 @@ class S4SMask(object):
                 elif self._range_param['axis'] == 'y':
                     return np.logical_and(y >= lower, y <= upper)
                 elif self._range_param['axis'] == 'z':
-                    z[np.isnan(z)] = upper + 100
+                    z = np.where(np.isnan(z), upper + 100, z)
                     return np.logical_and(z >= lower, z <= upper)
 
+        elif self.is_polygon_type:
+            # Even-odd ray casting, only the points inside the bounding box are tested against the edges
+            x_min, x_max, y_min, y_max = self.get_xy_bounds()
+            test = np.zeros(x.shape, dtype=bool)
+            index = np.nonzero(np.logical_and(np.logical_and(x >= x_min, x <= x_max),
+                                              np.logical_and(y >= y_min, y <= y_max)))
+            px = x[index]
+            py = y[index]
+            inside = np.zeros(px.shape, dtype=bool)
+            vertices = self._polygon_param['vertices']
+            for k in range(vertices.shape[0]):
+                x0, y0 = vertices[k - 1]
+                x1, y1 = vertices[k]
+                if y0 == y1:
+                    continue
+                crossing = np.logical_or(np.logical_and(y0 <= py, py < y1), np.logical_and(y1 <= py, py < y0))
+                crossing[crossing] = px[crossing] < x0 + (py[crossing] - y0) * (x1 - x0) / (y1 - y0)
+                inside ^= crossing
+            test[index] = inside
+            return np.logical_not(test) if self.is_excluding else test
+
         return False
@@ -0,0 +1,97 @@
+__author__ = 'Musa Morena Marcusso Manhaes'
+
+import numpy as np
+
+
+class S4SMaskExpression(object):
+    # Boolean expression over the filtering masks, the leaves hold the index of a S4SMask in S4SData
+    _OPERATORS = ['mask', 'and', 'or', 'not']
+
+    def __init__(self, operator, operands):
+        if operator not in self._OPERATORS:
+            raise ValueError('Invalid operator, operator=' + str(operator))
+        if type(operands) not in [list, tuple]:
+            operands = [operands]
+        if operator == 'mask':
+            if len(operands) != 1 or type(operands[0]) is not int:
+                raise TypeError('A mask leaf must hold a single mask index')
+        else:
+            if not all([isinstance(op, S4SMaskExpression) for op in operands]):
+                raise TypeError('The operands must be mask expressions')
+            if operator == 'not' and len(operands) != 1:
+                raise ValueError('The not operator takes a single operand')
+            if operator in ['and', 'or'] and len(operands) < 2:
+                raise ValueError('The %s operator takes at least two operands' % operator)
+        self._operator = operator
+        self._operands = list(operands)
+
+    @classmethod
+    def from_tuple(cls, expression):
+        # Build the tree from nested tuples, e.g. ('and', ('or', 0, 1), ('not', 2)), integers are mask indexes
+        if isinstance(expression, S4SMaskExpression):
+            return expression
+        if type(expression) is int:
+            return cls('mask', expression)
+        if type(expression) not in [list, tuple] or len(expression) < 2:
+            raise ValueError('Invalid mask expression, expression=' + str(expression))
+        return cls(expression[0], [cls.from_tuple(op) for op in expression[1:]])
+
+    def to_tuple(self):
+        if self._operator == 'mask':
+            return self._operands[0]
+        return tuple([self._operator] + [op.to_tuple() for op in self._operands])
+
+    @property
+    def operator(self):
+        return self._operator
+
+    @property
+    def operands(self):
+        return self._operands
+
+    def get_mask_indexes(self):
+        if self._operator == 'mask':
+            return set(self._operands)
+        indexes = set()
+        for op in self._operands:
+            indexes |= op.get_mask_indexes()
+        return indexes
+
+    def compile(self):
+        # Returns a function evaluating the whole tree for one block, fcn(get_leaf) where get_leaf(index) returns
+        # a new boolean array for the block. The result of the first operand is reused as output buffer
+        if self._operator == 'mask':
+            index = self._operands[0]
+            return lambda get_leaf: get_leaf(index)
+
+        operands = [op.compile() for op in self._operands]
+        if self._operator == 'not':
+            def evaluate(get_leaf):
+                result = operands[0](get_leaf)
+                return np.logical_not(result, out=result)
+            return evaluate
+
+        ufunc = np.logical_and if self._operator == 'and' else np.logical_or
+
+        def evaluate(get_leaf):
+            result = operands[0](get_leaf)
+            for op in operands[1:]:
+                ufunc(result, op(get_leaf), out=result)
+            return result
+        return evaluate
+
+    def __and__(self, other):
+        return S4SMaskExpression('and', [self, self.from_tuple(other)])
+
+    def __or__(self, other):
+        return S4SMaskExpression('or', [self, self.from_tuple(other)])
+
+    def __invert__(self):
+        return S4SMaskExpression('not', [self])
+
+    def __str__(self):
+        if self._operator == 'mask':
+            return str(self._operands[0])
+        if self._operator == 'not':
+            return 'not ' + str(self._operands[0])
+        return '(' + (' ' + self._operator + ' ').join([str(op) for op in self._operands]) + ')'
@@ -0,0 +1,170 @@
+__author__ = 'Musa Morena Marcusso Manhaes'
+
+import os
+import multiprocessing
+from multiprocessing.sharedctypes import RawArray
+import numpy as np
+import S4SParser
+
+# Shared output buffer, set in each worker process by the pool initializer
+_SHARED_POINTS = None
+
+
+def _init_worker(shared_points):
+    global _SHARED_POINTS
+    _SHARED_POINTS = shared_points
+
+
+def _count_lines(args):
+    filename, start, end, block_size = args
+    n_lines = 0
+    last = '\n'
+    fid = open(filename, 'rb')
+    try:
+        fid.seek(start)
+        n_left = end - start
+        while n_left > 0:
+            block = fid.read(min(block_size, n_left))
+            if not block:
+                break
+            n_lines += block.count('\n')
+            last = block[-1]
+            n_left -= len(block)
+    finally:
+        fid.close()
+    # A last line without line break still counts as a row
+    return n_lines + (1 if last != '\n' else 0)
+
+
+def _parse_range(args):
+    filename, start, end, offset, capacity, options = args
+    comments, separator, dtype = options
+    parser = S4SParser.S4SParser(comments=comments, separator=separator, skip_row=0, dtype=dtype)
+    points = np.ctypeslib.as_array(_SHARED_POINTS).view(parser.dtype).reshape(-1, 3)
+
+    n_rows = 0
+    fid = open(filename, 'rb')
+    try:
+        fid.seek(start)
+        for rows, n_bytes in parser.iter_file(_RangeReader(fid, end - start)):
+            if n_rows + rows.shape[0] > capacity:
+                raise ValueError('More rows than lines found in the byte range [%d, %d]' % (start, end))
+            points[offset + n_rows:offset + n_rows + rows.shape[0]] = rows
+            n_rows += rows.shape[0]
+    finally:
+        fid.close()
+    return offset, n_rows, end - start
+
+
+class _RangeReader(object):
+    # File-like object that stops reading at the end of a byte range
+    def __init__(self, file_obj, n_bytes):
+        self._file_obj = file_obj
+        self._n_left = n_bytes
+
+    def read(self, size):
+        if self._n_left <= 0:
+            return ''
+        block = self._file_obj.read(min(size, self._n_left))
+        self._n_left -= len(block)
+        return block
+
+
+class S4SParallelParser(object):
+    # Maximum number of bytes parsed by a worker per task, bounds the cancellation latency
+    _MAX_RANGE_SIZE = 64 * 1024 * 1024
+    # Number of tasks per process, helps balancing ranges with different parsing costs
+    _TASKS_PER_PROCESS = 4
+    _CTYPES = {'float64': 'd', 'float32': 'f'}
+
+    def __init__(self, parser, n_processes=None):
+        if not isinstance(parser, S4SParser.S4SParser):
+            raise TypeError('Invalid parser object')
+        if n_processes is None:
+            n_processes = multiprocessing.cpu_count()
+        if n_processes < 1:
+            raise ValueError('The number of processes must be greater than zero')
+        self._parser = parser
+        self._n_processes = int(n_processes)
+
+    @property
+    def n_processes(self):
+        return self._n_processes
+
+    def get_byte_ranges(self, filename):
+        # Split the file into ranges that start right after a line break
+        file_size = os.path.getsize(filename)
+        fid = open(filename, 'rb')
+        try:
+            start = self._get_data_start(fid)
+            n_ranges = max(self._n_processes * self._TASKS_PER_PROCESS,
+                           int(np.ceil((file_size - start) / float(self._MAX_RANGE_SIZE))))
+            bounds = [start]
+            for offset in np.linspace(start, file_size, n_ranges + 1)[1:-1]:
+                offset = max(int(offset), bounds[-1])
+                fid.seek(offset)
+                fid.readline()
+                bounds.append(min(fid.tell(), file_size))
+            bounds.append(file_size)
+        finally:
+            fid.close()
+        return [(s, e) for s, e in zip(bounds[:-1], bounds[1:]) if e > s]
+
+    def parse_file(self, filename, is_running=None, progress_fcn=None):
+        # Returns a (N, 3) array or None if is_running() turns False before the file is parsed
+        if not os.path.isfile(filename):
+            raise ValueError('Invalid filename, file=' + str(filename))
+
+        ranges = self.get_byte_ranges(filename)
+        if len(ranges) == 0:
+            return np.empty((0, 3), dtype=self._parser.dtype)
+
+        # Number of lines is an upper bound for the number of rows of each range
+        pool = multiprocessing.Pool(self._n_processes)
+        try:
+            capacities = pool.map(_count_lines, [(filename, s, e, S4SParser.S4SParser._BLOCK_SIZE)
+                                                 for s, e in ranges])
+        finally:
+            pool.close()
+            pool.join()
+
+        offsets = np.concatenate(([0], np.cumsum(capacities)))
+        shared_points = RawArray(self._CTYPES[self._parser.dtype.name], int(offsets[-1]) * 3)
+        options = (self._parser.comments, self._parser.separator, self._parser.dtype.name)
+        tasks = [(filename, r[0], r[1], int(offsets[i]), capacities[i], options) for i, r in enumerate(ranges)]
+
+        n_rows = {}
+        n_bytes = 0
+        pool = multiprocessing.Pool(self._n_processes, initializer=_init_worker, initargs=(shared_points,))
+        try:
+            for offset, rows, range_size in pool.imap_unordered(_parse_range, tasks):
+                if is_running is not None and not is_running():
+                    pool.terminate()
+                    return None
+                n_rows[offset] = rows
+                n_bytes += range_size
+                if progress_fcn is not None:
+                    progress_fcn(n_bytes, sum(n_rows.values()))
+            pool.close()
+        except:
+            pool.terminate()
+            raise
+        finally:
+            pool.join()
+
+        # Move the parsed rows of each range together, in place
+        points = np.ctypeslib.as_array(shared_points).view(self._parser.dtype).reshape(-1, 3)
+        n_total = 0
+        for offset in sorted(n_rows.keys()):
+            if offset != n_total:
+                points[n_total:n_total + n_rows[offset]] = points[offset:offset + n_rows[offset]]
+            n_total += n_rows[offset]
+        return points[:n_total]
+
+    def _get_data_start(self, fid):
+        # The rows skipped at the beginning of the file are not part of any range
+        fid.seek(0)
+        for i in range(self._parser.skip_row):
+            if not fid.readline():
+                break
+        return fid.tell()
@@ -0,0 +1,182 @@
+__author__ = 'Musa Morena Marcusso Manhaes'
+
+import os
+import warnings
+import numpy as np
+import S4SPointBuffer
+
+
+class S4SParser(object):
+    # Number of bytes read from the measurement file per block
+    _BLOCK_SIZE = 16 * 1024 * 1024
+    # Number of columns (X, Y, Z) expected in each line
+    _N_COLS = 3
+    # Headroom added to the estimated number of rows before growing the output
+    _CAPACITY_MARGIN = 1.05
+    # Texts smaller than this are parsed line by line when they contain invalid lines
+    _MIN_SPLIT_SIZE = 4096
+
+    def __init__(self, comments='#', separator=' ', skip_row=0, dtype=np.float64):
+        if comments is None:
+            comments = ''
+        if separator is None:
+            separator = ''
+        if type(comments) is not str or type(separator) is not str:
+            raise TypeError('Comment and separator options must be strings')
+        if int(skip_row) < 0:
+            raise ValueError('The number of rows to skip cannot be negative')
+        if np.dtype(dtype) not in [np.dtype(np.float32), np.dtype(np.float64)]:
+            raise ValueError('The output type must be either float32 or float64')
+
+        self._comments = comments
+        # Whitespace separators are already handled by the numeric parser
+        self._separator = separator if len(separator.strip()) else ''
+        self._skip_row = int(skip_row)
+        self._dtype = np.dtype(dtype)
+
+    @property
+    def comments(self):
+        return self._comments
+
+    @property
+    def separator(self):
+        return self._separator
+
+    @property
+    def skip_row(self):
+        return self._skip_row
+
+    @property
+    def dtype(self):
+        return self._dtype
+
+    def parse_block(self, text):
+        # Convert a block of complete lines into a (N, 3) array
+        if self._separator:
+            text = text.replace(self._separator, ' ')
+
+        blocks = []
+        self._parse_text(text, blocks)
+        if len(blocks) == 0:
+            return np.empty((0, self._N_COLS), dtype=self._dtype)
+        rows = blocks[0] if len(blocks) == 1 else np.concatenate(blocks)
+        # Rows with NaN or infinite values are dropped
+        is_finite = np.isfinite(rows).all(axis=1)
+        if not is_finite.all():
+            rows = rows[is_finite]
+        return rows
+
+    def _parse_text(self, text, blocks):
+        if not self._comments or text.find(self._comments) == -1:
+            # Fast path, the whole text is decoded at once by numpy. It is only used if every line holds either
+            # _N_COLS values or none, otherwise lines with a different number of values would be merged into rows
+            n_values = self._get_line_sizes(text)
+            n_lines = np.count_nonzero(n_values == self._N_COLS)
+            if n_lines + np.count_nonzero(n_values == 0) == n_values.size:
+                values = self._from_string(text)
+                if values.size == n_lines * self._N_COLS:
+                    if values.size:
+                        blocks.append(values.reshape(-1, self._N_COLS))
+                    return
+
+        # Headers, comments or invalid lines were found, bisect the text to isolate them
+        middle = text.find('\n', len(text) / 2)
+        if len(text) > self._MIN_SPLIT_SIZE and middle != -1 and middle < len(text) - 1:
+            self._parse_text(text[:middle + 1], blocks)
+            self._parse_text(text[middle + 1:], blocks)
+            return
+
+        rows = []
+        for line in text.split('\n'):
+            if self._comments and line.find(self._comments) != -1:
+                continue
+            elems = line.split()
+            if len(elems) != self._N_COLS:
+                continue
+            try:
+                rows.append([float(x) for x in elems])
+            except ValueError:
+                continue
+        if len(rows):
+            blocks.append(np.array(rows, dtype=self._dtype))
+
+    def parse_file(self, filename):
+        # Parse the whole file into a (N, 3) array
+        if not os.path.isfile(filename):
+            raise ValueError('Invalid filename, file=' + str(filename))
+
+        buffer = S4SPointBuffer.S4SPointBuffer(dtype=self._dtype)
+        file_size = os.path.getsize(filename)
+        file_obj = open(filename, 'rb')
+        try:
+            for rows, n_bytes in self.iter_file(file_obj):
+                if buffer.capacity == 0:
+                    buffer.reserve(self.estimate_capacity(file_size, n_bytes, rows.shape[0]))
+                buffer.append(rows)
+        finally:
+            file_obj.close()
+        return buffer.data
+
+    def iter_file(self, file_obj):
+        # Read the file object in fixed-size chunks, yielding the parsed rows and the number of bytes read
+        n_skipped = 0
+        carry = ''
+        while True:
+            block = file_obj.read(self._BLOCK_SIZE)
+            if not block:
+                text = carry
+                carry = ''
+            else:
+                text = carry + block
+                end = text.rfind('\n')
+                if end == -1:
+                    carry = text
+                    yield np.empty((0, self._N_COLS), dtype=self._dtype), len(block)
+                    continue
+                carry = text[end + 1:]
+                text = text[:end + 1]
+
+            if n_skipped < self._skip_row:
+                text, n_skipped = self._skip_lines(text, n_skipped)
+
+            if len(text):
+                yield self.parse_block(text), len(block)
+
+            if not block:
+                break
+
+    def estimate_capacity(self, file_size, n_bytes, n_rows):
+        # Estimate the total number of rows in a file from the rows found in its first bytes
+        if n_rows == 0 or n_bytes == 0:
+            return max(n_rows, 1024)
+        return max(int(file_size * self._CAPACITY_MARGIN * n_rows / float(n_bytes)), n_rows)
+
+    def _skip_lines(self, text, n_skipped):
+        n_left = self._skip_row - n_skipped
+        parts = text.split('\n', n_left)
+        if len(parts) <= n_left:
+            return '', n_skipped + text.count('\n')
+        return parts[-1], self._skip_row
+
+    def _get_line_sizes(self, text):
+        # Number of whitespace separated values in each line of the text, the whitespace characters are all
+        # below or equal to the space character
+        chars = np.frombuffer(text, dtype=np.uint8)
+        if chars.size == 0:
+            return np.empty(0, dtype=np.intp)
+        is_value = chars > ord(' ')
+        # First character of each value
+        starts = is_value.copy()
+        starts[1:] &= np.logical_not(is_value[:-1])
+        # First character of each line
+        line_starts = np.flatnonzero(chars == ord('\n')) + 1
+        line_starts = np.concatenate(([0], line_starts[line_starts < chars.size]))
+        return np.add.reduceat(starts.view(np.uint8), line_starts, dtype=np.intp)
+
+    def _from_string(self, text):
+        if not len(text.strip()):
+            return np.empty(0, dtype=self._dtype)
+        with warnings.catch_warnings():
+            # Newer numpy versions warn when the text cannot be read until its end
+            warnings.simplefilter('ignore', DeprecationWarning)
+            return np.fromstring(text, dtype=self._dtype, sep=' ')
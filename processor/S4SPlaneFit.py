@@ -0,0 +1,141 @@
+__author__ = 'Musa Morena Marcusso Manhaes'
+
+from time import time
+import numpy as np
+
+
+class S4SPlaneFit(object):
+    # Least-squares plane z = a * x + b * y + c solved in closed form from the moments of the points
+    # [n, sum(x), sum(y), sum(z), sum(x^2), sum(x * y), sum(y^2), sum(x * z), sum(y * z)]. The coordinates are taken
+    # relative to the origin to keep the moments well conditioned
+    _N_MOMENTS = 9
+    # Number of three-point plane hypotheses scored at once by the robust fit
+    _RANSAC_BATCH_SIZE = 64
+    # Probability of drawing at least one outlier-free hypothesis used to stop the robust fit early
+    _RANSAC_CONFIDENCE = 0.99
+    # Inlier threshold in robust standard deviations of the residuals
+    _RANSAC_THRESHOLD = 2.5
+
+    def __init__(self, origin=(0.0, 0.0)):
+        if len(origin) != 2:
+            raise ValueError('The origin must have two elements (XY-plane)')
+        self._origin = np.array(origin, dtype=np.float64)
+        self._moments = np.zeros(self._N_MOMENTS)
+
+    @property
+    def origin(self):
+        return self._origin
+
+    @property
+    def moments(self):
+        return self._moments
+
+    @property
+    def n_points(self):
+        return int(round(self._moments[0]))
+
+    def clear(self):
+        self._moments = np.zeros(self._N_MOMENTS)
+
+    def add_points(self, x, y, z, weight=1.0):
+        # Add (weight = 1) or remove (weight = -1) the moments of a set of points
+        x = np.asarray(x, dtype=np.float64).ravel() - self._origin[0]
+        y = np.asarray(y, dtype=np.float64).ravel() - self._origin[1]
+        z = np.asarray(z, dtype=np.float64).ravel()
+        if x.shape != y.shape or x.shape != z.shape:
+            raise ValueError('The X, Y and Z vectors must have the same size')
+        self._moments += weight * np.array([x.size, x.sum(), y.sum(), z.sum(),
+                                            np.dot(x, x), np.dot(x, y), np.dot(y, y), np.dot(x, z), np.dot(y, z)])
+
+    def add_grid(self, x_axis, y_axis, z, mask, weight=1.0):
+        # Add the moments of the selected cells of a regular grid given by its 1-D axes, the X and Y sums are
+        # computed from the number of selected cells per column and row
+        if z.shape != (len(y_axis), len(x_axis)) or mask.shape != z.shape:
+            raise ValueError('The Z matrix and the mask must have the shape of the grid axes')
+        x = np.asarray(x_axis, dtype=np.float64) - self._origin[0]
+        y = np.asarray(y_axis, dtype=np.float64) - self._origin[1]
+        n_cols = np.count_nonzero(mask, axis=0)
+        n_rows = np.count_nonzero(mask, axis=1)
+        z = np.where(mask, z, 0.0)
+        z_cols = z.sum(axis=0, dtype=np.float64)
+        z_rows = z.sum(axis=1, dtype=np.float64)
+        self._moments += weight * np.array([n_cols.sum(), np.dot(n_cols, x), np.dot(n_rows, y), z_rows.sum(),
+                                            np.dot(n_cols, x * x), np.dot(y, np.dot(mask, x)), np.dot(n_rows, y * y),
+                                            np.dot(z_cols, x), np.dot(z_rows, y)])
+
+    def solve(self):
+        # Returns the plane parameters [a, b, -1, c] used by plane_eval, i.e. a * x + b * y - z + c = 0
+        n, sx, sy, sz, sxx, sxy, syy, sxz, syz = self._moments
+        if n < 3:
+            raise ValueError('At least three points are needed to fit a plane')
+        a = np.array([[sxx, sxy, sx],
+                      [sxy, syy, sy],
+                      [sx, sy, n]])
+        b = np.array([sxz, syz, sz])
+        # Least-squares solution also handles degenerate point sets, e.g. all points on a line
+        param = np.linalg.lstsq(a, b, rcond=None)[0]
+        return np.array([param[0], param[1], -1.0,
+                         param[2] - param[0] * self._origin[0] - param[1] * self._origin[1]])
+
+    @classmethod
+    def fit_ransac(cls, x, y, z, threshold=None, max_iterations=1000, max_time=1.0, random_state=None):
+        # Robust plane from random three-point hypotheses scored in batches against all given points. Without
+        # threshold the hypotheses are ranked by the median of the absolute residuals (least median of squares) and
+        # the inlier threshold is derived from it. Returns the plane parameters and the inlier threshold
+        x = np.asarray(x, dtype=np.float64).ravel()
+        y = np.asarray(y, dtype=np.float64).ravel()
+        z = np.asarray(z, dtype=np.float64).ravel()
+        n = x.size
+        if n < 3:
+            raise ValueError('At least three points are needed to fit a plane')
+        if not isinstance(random_state, np.random.RandomState):
+            random_state = np.random.RandomState(random_state)
+
+        origin = (x.mean(), y.mean())
+        x = x - origin[0]
+        y = y - origin[1]
+        points = np.vstack((x, y, z)).T
+
+        best = None
+        best_score = np.inf
+        best_threshold = threshold
+        n_needed = max_iterations
+        n_iterations = 0
+        start = time()
+        while n_iterations < min(max_iterations, n_needed) and (best is None or time() - start < max_time):
+            index = random_state.randint(0, n, size=(cls._RANSAC_BATCH_SIZE, 3))
+            normal = np.cross(points[index[:, 1]] - points[index[:, 0]], points[index[:, 2]] - points[index[:, 0]])
+            n_iterations += cls._RANSAC_BATCH_SIZE
+            # Hypotheses from collinear points or from vertical planes are discarded
+            valid = np.abs(normal[:, 2]) > 1e-9 * np.abs(normal).sum(axis=1)
+            if not np.any(valid):
+                continue
+            a = -normal[valid, 0] / normal[valid, 2]
+            b = -normal[valid, 1] / normal[valid, 2]
+            p0 = points[index[valid, 0]]
+            c = p0[:, 2] - a * p0[:, 0] - b * p0[:, 1]
+
+            residual = np.abs(z - a[:, np.newaxis] * x - b[:, np.newaxis] * y - c[:, np.newaxis])
+            if threshold is None:
+                score = np.median(residual, axis=1)
+            else:
+                score = -np.count_nonzero(residual <= threshold, axis=1)
+            k = np.argmin(score)
+            if score[k] >= best_score:
+                continue
+
+            best = (a[k], b[k], c[k])
+            best_score = score[k]
+            if threshold is None:
+                # Robust standard deviation from the median with the small sample correction
+                best_threshold = cls._RANSAC_THRESHOLD * 1.4826 * (1.0 + 5.0 / max(n - 3, 1)) * best_score
+            inliers = np.count_nonzero(residual[k] <= best_threshold) / float(n)
+            if inliers >= 1.0:
+                n_needed = 0
+            elif inliers > 0.0:
+                n_needed = np.log(1.0 - cls._RANSAC_CONFIDENCE) / np.log(1.0 - inliers ** 3)
+
+        if best is None:
+            raise ValueError('All the points are collinear')
+        a, b, c = best
+        return np.array([a, b, -1.0, c - a * origin[0] - b * origin[1]]), best_threshold
@@ -0,0 +1,55 @@
+__author__ = 'Musa Morena Marcusso Manhaes'
+
+import numpy as np
+
+
+class S4SPointBuffer(object):
+    # Factor used to grow the buffer when the reserved capacity is exceeded
+    _GROWTH_FACTOR = 1.5
+
+    def __init__(self, n_cols=3, dtype=np.float64):
+        if n_cols < 1:
+            raise ValueError('The number of columns must be greater than zero')
+        self._n_cols = n_cols
+        self._dtype = np.dtype(dtype)
+        self._buffer = np.empty((0, self._n_cols), dtype=self._dtype)
+        self._n_rows = 0
+
+    @property
+    def n_rows(self):
+        return self._n_rows
+
+    @property
+    def capacity(self):
+        return self._buffer.shape[0]
+
+    @property
+    def nbytes(self):
+        return self._buffer.nbytes
+
+    @property
+    def data(self):
+        return self._buffer[:self._n_rows]
+
+    def reserve(self, capacity):
+        capacity = int(capacity)
+        if capacity <= self._buffer.shape[0]:
+            return
+        new_buffer = np.empty((capacity, self._n_cols), dtype=self._dtype)
+        new_buffer[:self._n_rows] = self._buffer[:self._n_rows]
+        self._buffer = new_buffer
+
+    def append(self, rows):
+        if rows.ndim != 2 or rows.shape[1] != self._n_cols:
+            raise ValueError('The rows must have %d columns' % self._n_cols)
+        n_new = rows.shape[0]
+        if n_new == 0:
+            return
+        if self._n_rows + n_new > self._buffer.shape[0]:
+            self.reserve(max(int(self._buffer.shape[0] * self._GROWTH_FACTOR), self._n_rows + n_new))
+        self._buffer[self._n_rows:self._n_rows + n_new] = rows
+        self._n_rows += n_new
+
+    def clear(self):
+        self._buffer = np.empty((0, self._n_cols), dtype=self._dtype)
+        self._n_rows = 0
@@ -0,0 +1,90 @@
+__author__ = 'Musa Morena Marcusso Manhaes'
+
+import os
+import numpy as np
+
+
+class S4SPointCache(object):
+    # Increase the version whenever the cache layout or the parser output changes
+    _VERSION = 2
+    _KEY_EXT = '.key'
+
+    def __init__(self, cache_file):
+        if type(cache_file) is not str or len(cache_file) == 0:
+            raise TypeError('The cache filename must be a non-empty string')
+        self._cache_file = cache_file
+        self._key_file = cache_file + self._KEY_EXT
+
+    @property
+    def cache_file(self):
+        return self._cache_file
+
+    @classmethod
+    def get_key(cls, data_file, parser):
+        # The name and directory of the measurement file are part of the key, copies of a scan often share the size
+        # and modification time
+        return {'version': str(cls._VERSION),
+                'file': os.path.basename(data_file),
+                'path': os.path.dirname(os.path.abspath(data_file)),
+                'size': str(os.path.getsize(data_file)),
+                'mtime': repr(os.path.getmtime(data_file)),
+                'comments': repr(parser.comments),
+                'separator': repr(parser.separator),
+                'skip_row': str(parser.skip_row),
+                'dtype': parser.dtype.name}
+
+    def is_valid(self, key):
+        if not os.path.isfile(self._cache_file) or not os.path.isfile(self._key_file):
+            return False
+        return self._read_key() == key
+
+    def load(self, key):
+        # Returns a read-only memory map of the cached points or None if the cache is missing or outdated
+        if not self.is_valid(key):
+            return None
+        try:
+            points = np.load(self._cache_file, mmap_mode='r')
+        except (IOError, ValueError):
+            return None
+        if points.ndim != 2 or points.shape[1] != 3 or points.dtype.name != key['dtype']:
+            return None
+        return points
+
+    def store(self, points, key):
+        # Write to temporary files first so a crash never leaves a valid key next to a partial cache
+        temp_file = self._cache_file + '.tmp'
+        temp_key_file = self._key_file + '.tmp'
+
+        cache_dir = os.path.dirname(self._cache_file)
+        if cache_dir and not os.path.isdir(cache_dir):
+            os.makedirs(cache_dir)
+        self.clear()
+        fid = open(temp_file, 'wb')
+        try:
+            np.save(fid, np.ascontiguousarray(points))
+        finally:
+            fid.close()
+
+        fid = open(temp_key_file, 'w')
+        for s in sorted(key.keys()):
+            fid.write(s + '=' + key[s] + '\n')
+        fid.close()
+
+        os.rename(temp_file, self._cache_file)
+        os.rename(temp_key_file, self._key_file)
+
+    def clear(self):
+        for filename in [self._key_file, self._cache_file]:
+            if os.path.isfile(filename):
+                os.remove(filename)
+
+    def _read_key(self):
+        key = {}
+        fid = open(self._key_file, 'r')
+        for line in fid:
+            s = line.rstrip('\n').split('=', 1)
+            if len(s) != 2:
+                continue
+            key[s[0]] = s[1]
+        fid.close()
+        return key
@@ -132,6 +132,9 @@ class S4SProcessor(object):
     def calc_fitting_plane(self):
         return self._data.calc_fitting_plane()
 
+    def get_binary_extensions(self):
+        return self._data.get_binary_extensions()
+
     def get_mask_labels(self):
         return self._data.get_mask_labels()
 
@@ -147,6 +150,9 @@ class S4SProcessor(object):
     def get_range_mask_param_labels(self):
         return self._data.get_range_mask_param_labels()
 
+    def get_polygon_mask_param_labels(self):
+        return self._data.get_polygon_mask_param_labels()
+
     def get_x_range(self):
         return self._data.range_x
 
@@ -169,11 +175,75 @@ class S4SProcessor(object):
         self._data.delete_all_masks()
         self.call_callbacks('update_data')
 
+    def get_interp_methods(self):
+        return ['auto'] + self._data.get_interp_methods()
+
+    def set_interp_method(self, method):
+        self._data.interp_method = method
+
+    def get_interp_method(self):
+        return self._data.interp_method
+
+    def regrid(self):
+        is_suc = self._data.regrid()
+        self.call_callbacks('update_data')
+        return is_suc
+
+    def interpolate_points(self, x, y, method=None):
+        return self._data.interpolate_points(x, y, method)
+
+    def set_use_float32(self, is_active):
+        self._data.use_float32 = is_active
+
+    def get_use_float32(self):
+        return self._data.use_float32
+
+    def set_use_grid(self, is_active):
+        self._data.use_grid = is_active
+
+    def get_use_grid(self):
+        return self._data.use_grid
+
+    def is_gridless(self):
+        return self._data.is_gridless
+
+    def set_use_preview(self, is_active):
+        self._data.use_preview = is_active
+
+    def get_use_preview(self):
+        return self._data.use_preview
+
+    def set_grid_pitch(self, pitch):
+        self._data.grid_pitch = pitch
+
+    def get_grid_pitch(self):
+        return self._data.grid_pitch
+
+    def set_max_grid_cells(self, n_cells):
+        self._data.max_grid_cells = n_cells
+
+    def get_max_grid_cells(self):
+        return self._data.max_grid_cells
+
+    def set_n_processes(self, n):
+        self._data.n_processes = n
+
+    def get_n_processes(self):
+        return self._data.n_processes
+
+    def set_grid_cache_size(self, new_size):
+        self._data.grid_cache_size = new_size
+
+    def get_grid_cache_size(self):
+        return self._data.grid_cache_size
+
     def stop_loading(self):
-        if self._data.thread_is_running:
-            self._data.thread_is_running = False
-            if self._load_file_thread is not None:
-                self._load_file_thread.join()
+        # The loading thread is joined even if it is not loading anymore, the preview or final callbacks it fires
+        # may still be running
+        self._data.thread_is_running = False
+        if self._load_file_thread is not None:
+            self._load_file_thread.join()
+            self._load_file_thread = None
 
     def load_file(self, path=None, filename=None, comment='#', separator=' ', skip_row=0):
         if path is not None:
@@ -188,7 +258,9 @@ class S4SProcessor(object):
                                                                            [lambda : self.call_callbacks(
                                                                                'update_data'),
                                                                             lambda : self.call_callbacks(
-                                                                                'is_loaded')]))
+                                                                                'is_loaded')],
+                                                                           [lambda : self.call_callbacks(
+                                                                               'update_data')]))
         self._load_file_thread.start()
 
     def get_points(self):
@@ -203,6 +275,12 @@ class S4SProcessor(object):
     def add_range_mask(self, lower=-0.1, upper=0.1, axis='x', is_exc=False):
         return self._data.add_range_mask(lower, upper, axis, is_exc)
 
+    def add_polygon_mask(self, vertices, is_exc=False):
+        return self._data.add_polygon_mask(vertices, is_exc)
+
+    def preview_mask(self, mask_type, points, is_exc, x, y, z):
+        return self._data.preview_mask(mask_type, points, is_exc, x, y, z)
+
     def set_mask_param(self, index, label, new_value):
         return self._data.set_mask_param(index, label, new_value)
 
@@ -213,6 +291,21 @@ class S4SProcessor(object):
             self._message_handler.push_message('Processor', 'info', 'New mask added, type=' + mask_label)
         return is_suc
 
+    def set_mask_expression(self, expression):
+        # Nested tuples of mask indexes, e.g. ('and', ('or', 0, 1), ('not', 2)), None combines the active masks
+        try:
+            self._data.mask_expression = expression
+        except (ValueError, TypeError), e:
+            self._message_handler.push_message('Processor', 'error', 'Invalid mask expression, error=' + str(e))
+            return False
+        self.call_callbacks('update_data')
+        return True
+
+    def get_mask_expression(self):
+        if self._data.mask_expression is None:
+            return None
+        return self._data.mask_expression.to_tuple()
+
     def get_mask_active(self, index):
         return self._data.is_mask_active(index)
 
@@ -241,5 +334,41 @@ class S4SProcessor(object):
     def get_use_plane(self):
         return self._data.use_plane
 
+    def get_plane_methods(self):
+        return self._data.get_plane_methods()
+
+    def set_plane_method(self, method):
+        self._data.plane_method = method
+        if self._data.use_plane:
+            self._data.calc_fitting_plane()
+            self.call_callbacks('update_data')
+
+    def get_plane_method(self):
+        return self._data.plane_method
+
+    def set_ransac_threshold(self, threshold):
+        self._data.ransac_threshold = threshold
+
+    def get_ransac_threshold(self):
+        return self._data.ransac_threshold
+
+    def get_form_orders(self):
+        return self._data.get_form_orders()
+
+    def set_form_order(self, order):
+        self._data.form_order = order
+        if self._data.use_plane:
+            self._data.calc_fitting_plane()
+            self.call_callbacks('update_data')
+
+    def get_form_order(self):
+        return self._data.form_order
+
+    def set_plane_fit_max_points(self, n_points):
+        self._data.plane_fit_max_points = n_points
+
+    def get_plane_fit_max_points(self):
+        return self._data.plane_fit_max_points
+
     def get_plane(self):
         return self._data.plane
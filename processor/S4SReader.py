@@ -0,0 +1,138 @@
+__author__ = 'Musa Morena Marcusso Manhaes'
+
+import os
+import numpy as np
+
+
+class S4SReader(object):
+    # Binary point formats, the readers map the file instead of copying it whenever possible
+    _READERS = {'f32': {'label': 'Raw interleaved float32 XYZ', 'fcn': lambda f: S4SReader.read_raw(f, np.float32)},
+                'f64': {'label': 'Raw interleaved float64 XYZ', 'fcn': lambda f: S4SReader.read_raw(f, np.float64)},
+                'ply': {'label': 'Binary PLY', 'fcn': lambda f: S4SReader.read_ply(f)}}
+
+    _PLY_TYPES = {'char': 'i1', 'int8': 'i1',
+                  'uchar': 'u1', 'uint8': 'u1',
+                  'short': 'i2', 'int16': 'i2',
+                  'ushort': 'u2', 'uint16': 'u2',
+                  'int': 'i4', 'int32': 'i4',
+                  'uint': 'u4', 'uint32': 'u4',
+                  'float': 'f4', 'float32': 'f4',
+                  'double': 'f8', 'float64': 'f8'}
+
+    _PLY_FORMATS = {'binary_little_endian': '<',
+                    'binary_big_endian': '>'}
+
+    @classmethod
+    def get_extensions(cls):
+        return sorted(cls._READERS.keys())
+
+    @classmethod
+    def get_label(cls, ext):
+        if ext not in cls._READERS:
+            return None
+        return cls._READERS[ext]['label']
+
+    @classmethod
+    def register_reader(cls, ext, label, fcn):
+        if type(ext) is not str or not ext.isalnum():
+            raise ValueError('The extension must be an alphanumeric string')
+        if not callable(fcn):
+            raise TypeError('The reader must be callable')
+        cls._READERS[ext.lower()] = {'label': label, 'fcn': fcn}
+
+    @classmethod
+    def get_reader(cls, filename):
+        ext = os.path.splitext(filename)[1][1:].lower()
+        if ext not in cls._READERS:
+            return None
+        return cls._READERS[ext]['fcn']
+
+    @classmethod
+    def is_supported(cls, filename):
+        return cls.get_reader(filename) is not None
+
+    @classmethod
+    def read_file(cls, filename):
+        reader = cls.get_reader(filename)
+        if reader is None:
+            raise ValueError('No binary reader available for this file, file=' + filename)
+        return reader(filename)
+
+    @staticmethod
+    def read_raw(filename, dtype):
+        dtype = np.dtype(dtype).newbyteorder('<')
+        n_bytes = os.path.getsize(filename)
+        if n_bytes % (3 * dtype.itemsize) != 0:
+            raise ValueError('File size is not a multiple of the XYZ record size, file=' + filename)
+        if n_bytes == 0:
+            return np.empty((0, 3), dtype=dtype)
+        return np.memmap(filename, dtype=dtype, mode='r', shape=(n_bytes / (3 * dtype.itemsize), 3))
+
+    @classmethod
+    def read_ply(cls, filename):
+        header, offset = cls._read_ply_header(filename)
+        if header['format'] not in cls._PLY_FORMATS:
+            raise ValueError('Only binary PLY files are supported, format=' + header['format'])
+
+        byte_order = cls._PLY_FORMATS[header['format']]
+        for name, count, props in header['elements']:
+            if any([p[1] is None for p in props]):
+                raise ValueError('List properties before the vertex element are not supported')
+            record = np.dtype([(p[0], byte_order + p[1]) for p in props])
+            if name == 'vertex':
+                break
+            offset += count * record.itemsize
+        else:
+            raise ValueError('No vertex element found in the PLY header')
+
+        names = [p[0] for p in props]
+        if not all([c in names for c in ['x', 'y', 'z']]):
+            raise ValueError('The vertex element must have the x, y and z properties')
+        if count == 0:
+            return np.empty((0, 3), dtype=record['x'])
+
+        vertices = np.memmap(filename, dtype=record, mode='r', offset=offset, shape=(count,))
+
+        index = names.index('x')
+        if names[index:index + 3] == ['x', 'y', 'z'] and record['x'] == record['y'] == record['z']:
+            # Consecutive coordinates of the same type are returned as a strided view of the mapped file
+            return np.ndarray(shape=(count, 3),
+                              dtype=record['x'],
+                              buffer=vertices,
+                              offset=record.fields['x'][1],
+                              strides=(record.itemsize, record['x'].itemsize))
+        return np.vstack((vertices['x'], vertices['y'], vertices['z'])).T
+
+    @classmethod
+    def _read_ply_header(cls, filename):
+        header = {'format': '', 'elements': []}
+        fid = open(filename, 'rb')
+        try:
+            if fid.readline().strip() != 'ply':
+                raise ValueError('Invalid PLY file, file=' + filename)
+            while True:
+                line = fid.readline()
+                if not line:
+                    raise ValueError('PLY header has no end_header line, file=' + filename)
+                s = line.split()
+                if len(s) == 0 or s[0] in ['comment', 'obj_info']:
+                    continue
+                if s[0] == 'end_header':
+                    break
+                if s[0] == 'format':
+                    header['format'] = s[1]
+                elif s[0] == 'element':
+                    header['elements'].append((s[1], int(s[2]), []))
+                elif s[0] == 'property':
+                    if len(header['elements']) == 0:
+                        raise ValueError('PLY property defined before any element')
+                    if s[1] == 'list':
+                        header['elements'][-1][2].append((s[-1], None))
+                    elif s[1] in cls._PLY_TYPES:
+                        header['elements'][-1][2].append((s[2], cls._PLY_TYPES[s[1]]))
+                    else:
+                        raise ValueError('Invalid PLY property type, type=' + s[1])
+            offset = fid.tell()
+        finally:
+            fid.close()
+        return header, offset
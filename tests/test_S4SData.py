@@ -0,0 +1,79 @@
+__author__ = 'Musa Morena Marcusso Manhaes'
+
+import os
+import sys
+import shutil
+import tempfile
+import unittest
+import numpy as np
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'processor'))
+import S4SData
+
+
+class TestResidualColor(unittest.TestCase):
+    # Tilted plane far from the origin, the residual to the fitted plane is the measurement noise and the
+    # interpolation error near the border of the grid
+    _NOISE = 1e-5
+    _MAX_RESIDUAL = 1e-3
+
+    def setUp(self):
+        self._temp_dir = tempfile.mkdtemp()
+        rs = np.random.RandomState(0)
+        x = rs.uniform(10.0, 20.0, 20000)
+        y = rs.uniform(-5.0, 3.0, 20000)
+        z = 0.01 * x + 0.02 * y + 50.0 + self._NOISE * rs.randn(x.size)
+        np.savetxt(os.path.join(self._temp_dir, 'plane.asc'), np.vstack((x, y, z)).T, fmt='%.7f')
+
+    def tearDown(self):
+        shutil.rmtree(self._temp_dir)
+
+    def _load(self, use_grid):
+        data = S4SData.S4SData()
+        data.use_cache = False
+        data.use_grid = use_grid
+        data.filename = (self._temp_dir, 'plane.asc')
+        self.assertTrue(data.open_file())
+        return data
+
+    def _check_residual(self, data):
+        range_c = data.range_c
+        self.assertLess(max(abs(range_c[0]), abs(range_c[1])), self._MAX_RESIDUAL)
+        color = data.calc_color()
+        self.assertLess(np.nanmax(np.abs(color)), self._MAX_RESIDUAL)
+        self.assertLess(np.nanmax(np.abs(data.data[3])), self._MAX_RESIDUAL)
+
+    def test_remove_offset_plane(self):
+        for use_grid in [True, False]:
+            data = self._load(use_grid)
+            data.use_plane = True
+            self._check_residual(data)
+            self.assertTrue(data.remove_offset())
+            self._check_residual(data)
+            # The displayed reference plane follows the translated points
+            x, y, plane = data.plane
+            self.assertLess(abs(plane.mean()), 1.0)
+
+    def test_remove_offset_form(self):
+        for use_grid in [True, False]:
+            data = self._load(use_grid)
+            data.form_order = 3
+            data.use_plane = True
+            self._check_residual(data)
+            self.assertTrue(data.remove_offset())
+            self._check_residual(data)
+
+    def test_regrid_keeps_offset(self):
+        for use_grid in [True, False]:
+            data = self._load(use_grid)
+            self.assertTrue(data.remove_offset())
+            data.regrid()
+            # The regenerated data stays centered and the interpolated points follow the translation
+            center = data.center_of_mass
+            self.assertLess(np.abs(center).max(), 0.05)
+            z = data.interpolate_points(np.array([center[0]]), np.array([center[1]]), 'linear')
+            self.assertLess(abs(z[0] - center[2]), self._MAX_RESIDUAL)
+
+
+if __name__ == '__main__':
+    unittest.main()